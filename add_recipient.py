@@ -1,39 +1,33 @@
 # add_recipient.py
 
-import json
 import sys
-import os
+from recipients import RECIPIENT_TYPES, RecipientRegistry
 
-def add_recipient(recipient_id: str, recipient_type: str):
-    if recipient_type not in ["individual", "group"]:
+def add_recipient(recipient_id: str, recipient_type: str, kids=None, path: str = "chat_ids.json"):
+    if recipient_type not in RECIPIENT_TYPES:
         print("Empfängertyp muss entweder 'individual' oder 'group' sein.")
         return
 
-    if os.path.exists("chat_ids.json"):
-        with open("chat_ids.json", "r") as f:
-            chat_ids = json.load(f)
-    else:
-        chat_ids = []
-
-    # Überprüfen, ob der Empfänger bereits vorhanden ist
-    for chat in chat_ids:
-        if chat["id"] == recipient_id:
-            print("Empfänger bereits vorhanden.")
-            return
-
-    # Empfänger hinzufügen
-    chat_ids.append({
-        "type": recipient_type,
-        "id": recipient_id
-    })
-
-    with open("chat_ids.json", "w") as f:
-        json.dump(chat_ids, f, indent=4)
+    # Die Datei wird gesperrt, gelesen und atomar ersetzt, ein laufender Notifier übernimmt die Änderung selbst
+    # Ohne Kinderliste wird der Empfänger über alle Kinder benachrichtigt
+    if not RecipientRegistry(path).add(recipient_id, recipient_type, kids):
+        print("Empfänger bereits vorhanden.")
+        return
     print(f"Empfänger {recipient_id} als {recipient_type} hinzugefügt.")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python add_recipient.py <RECIPIENT_ID> <TYPE>")
+    args = sys.argv[1:]
+    path = "chat_ids.json"
+    # Bei mehreren Konten hat jedes Konto seine eigene Empfängerdatei
+    for arg in list(args):
+        if arg.startswith("--file="):
+            path = arg[len("--file="):]
+            args.remove(arg)
+
+    if len(args) < 2:
+        print("Usage: python add_recipient.py [--file=<CHAT_IDS_FILE>] <RECIPIENT_ID> <TYPE> [KID ...]")
         print("TYPE kann entweder 'individual' oder 'group' sein.")
+        print("KID ist die HortPro-ID oder der Vorname eines Kindes (Standard: alle Kinder).")
+        print("Entfernen, Import und Export: python recipients.py --help")
     else:
-        add_recipient(sys.argv[1], sys.argv[2])
+        add_recipient(args[0], args[1], args[2:], path=path)
@@ -0,0 +1,187 @@
+# bench/fake_hortpro.py
+
+import ast
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+PRESENCES_PATH = re.compile(r"^/api/kids/([^/]+)/presences$")
+
+
+def load_fixture_rows(path: str) -> List[dict]:
+    """Presence rows from a captured app.log (like test.json) or from a JSON list of rows."""
+    with open(path, 'r') as f:
+        content = f.read()
+    try:
+        data = json.loads(content)
+        return data if isinstance(data, list) else data.get("data", data).get("rows", [])
+    except ValueError:
+        pass
+    rows = {}
+    for line in content.splitlines():
+        _, marker, payload = line.partition("Get Presences Response JSON: ")
+        if not marker:
+            continue
+        try:
+            data = ast.literal_eval(payload.strip())
+        except (ValueError, SyntaxError):
+            continue
+        if not isinstance(data, dict):
+            continue
+        for row in data.get("data", {}).get("rows", []):
+            rows[row["id"]] = row
+    return sorted(rows.values(), key=lambda row: row["date_start"], reverse=True)
+
+
+class FakeHortPro:
+    """Local stand-in for the HortPro parent portal API, scripted from Python."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._passwords = {}
+        self._kids = {}
+        self._presences = {}
+        self._sessions = {}
+        # Wall clock time each presence appeared or changed, compared with the fake signal-cli log for latency
+        self.changed_at = {}
+        self.requests = {"login": 0, "kids": 0, "presences": 0, "unauthorized": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_account(self, email: str, password: str, kids: List[dict]):
+        with self._lock:
+            self._passwords[email] = password
+            self._kids[email] = kids
+            for kid in kids:
+                self._presences.setdefault(kid["id"], [])
+
+    def set_presences(self, kid_id: str, rows: List[dict]):
+        with self._lock:
+            self._presences[kid_id] = sorted(rows, key=lambda row: row["date_start"], reverse=True)
+
+    def check_in(self, kid_id: str, at: Optional[datetime] = None) -> str:
+        row = {"id": str(uuid.uuid4()), "date_start": (at or datetime.now().astimezone()).isoformat(timespec="seconds"),
+               "date_end": None, "duration": None}
+        with self._lock:
+            self._presences.setdefault(kid_id, []).insert(0, row)
+            self.changed_at[row["id"]] = time.time()
+        return row["id"]
+
+    def check_out(self, kid_id: str, at: Optional[datetime] = None) -> Optional[str]:
+        with self._lock:
+            open_rows = [row for row in self._presences.get(kid_id, []) if not row["date_end"]]
+            if not open_rows:
+                return None
+            row = open_rows[0]
+            end = at or datetime.now().astimezone()
+            row["date_end"] = end.isoformat(timespec="seconds")
+            row["duration"] = int((end - datetime.fromisoformat(row["date_start"])).total_seconds() // 60)
+            self.changed_at[row["id"]] = time.time()
+            return row["id"]
+
+    def invalidate_sessions(self):
+        # Forces every client through the 401 and re-login path
+        with self._lock:
+            self._sessions.clear()
+
+    def total_requests(self) -> int:
+        return sum(count for key, count in self.requests.items() if key != "unauthorized")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-hortpro", daemon=True)
+        self._thread.start()
+        logger.info(f"Fake HortPro listening on {self.url}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: dict, cookie: str = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if cookie:
+                    self.send_header("Set-Cookie", f"sid-hep={cookie}; Path=/; HttpOnly")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _email(self) -> Optional[str]:
+                for part in self.headers.get("Cookie", "").split(";"):
+                    name, _, value = part.strip().partition("=")
+                    if name == "sid-hep":
+                        return fake._sessions.get(value)
+                return None
+
+            def do_POST(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if urlparse(self.path).path != "/api/user/login":
+                    return self._reply(404, {"success": False})
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                token = None
+                with fake._lock:
+                    fake.requests["login"] += 1
+                    if fake._passwords.get(payload.get("email")) == payload.get("password"):
+                        token = secrets.token_hex(16)
+                        fake._sessions[token] = payload["email"]
+                if token is None:
+                    return self._reply(401, {"success": False, "message": "Invalid credentials"})
+                self._reply(200, {"success": True}, cookie=token)
+
+            def do_GET(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                url = urlparse(self.path)
+                with fake._lock:
+                    status, body = self._get(url)
+                self._reply(status, body)
+
+            def _get(self, url):
+                email = self._email()
+                if email is None:
+                    fake.requests["unauthorized"] += 1
+                    return 401, {"success": False}
+                if url.path == "/api/kids":
+                    fake.requests["kids"] += 1
+                    return 200, {"success": True, "data": fake._kids.get(email, [])}
+                match = PRESENCES_PATH.match(url.path)
+                if not match or not any(kid["id"] == match.group(1) for kid in fake._kids.get(email, [])):
+                    return 404, {"success": False}
+                fake.requests["presences"] += 1
+                query = parse_qs(url.query)
+                start = int(query.get("start", ["0"])[0])
+                limit = int(query.get("limit", ["5"])[0])
+                rows = fake._presences[match.group(1)]
+                # Copies, the response is serialized after the lock is released
+                page = [dict(row) for row in rows[start:start + limit]]
+                return 200, {"success": True, "data": {"count": len(rows), "rows": page}}
+
+        return Handler
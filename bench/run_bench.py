@@ -0,0 +1,252 @@
+# bench/run_bench.py
+"""Runs the real engine, dispatcher and sender against a fake HortPro server and a fake signal-cli.
+
+    python -m bench.run_bench --accounts 1 10 1000 --json results.json
+    python -m bench.run_bench --baseline results.json
+
+Nothing leaves the machine: every account, kid and recipient is simulated.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from bench.fake_hortpro import FakeHortPro, load_fixture_rows
+from dispatcher import NotificationDispatcher
+from engine import PollingEngine
+from logconfig import setup_logging
+from models import AccountConfig
+from signal_cli import SignalSender
+
+logger = logging.getLogger(__name__)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_SIGNAL_CLI = os.path.join(BENCH_DIR, "fake-signal-cli")
+FIXTURE = os.path.join(os.path.dirname(BENCH_DIR), "test.json")
+# Metrics where a higher value is a regression
+LOWER_IS_BETTER = ("latency_p50", "latency_p95", "requests_per_event", "launches_per_event")
+
+
+def _recipient(index: int) -> str:
+    return f"+4915{index:08d}"
+
+
+def _read_signal_log(path: str, since: float):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [entry for entry in map(json.loads, f) if entry["time"] >= since]
+
+
+def _write_setup(workdir: str, accounts: int):
+    schedule_file = os.path.join(workdir, "scheduler.csv")
+    with open(schedule_file, "w") as f:
+        # 00:00 to 00:00 is an overnight window, i.e. the whole day
+        f.write("day_of_week,start_time,end_time\n")
+        for day in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"):
+            f.write(f"{day},00:00,00:00\n")
+
+    configs = []
+    for index in range(accounts):
+        chat_ids_path = os.path.join(workdir, f"chat_ids_{index}.json")
+        with open(chat_ids_path, "w") as f:
+            json.dump([{"id": _recipient(index), "type": "individual"}], f)
+        configs.append(AccountConfig(
+            name=f"bench{index}",
+            email=f"parent{index}@bench.local",
+            password=f"secret{index}",
+            cookie_path=os.path.join(workdir, f"cookie_{index}.txt"),
+            chat_ids_path=chat_ids_path,
+            schedule_file=schedule_file,
+            state_path=os.path.join(workdir, f"notifications_sent_{index}.json"),
+        ))
+    return configs
+
+
+async def _wait_for(condition, timeout: float, interval: float = 0.1) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(interval)
+    return condition()
+
+
+async def _measure(engine, server, accounts: int, signal_log: str, args) -> dict:
+    engine_task = asyncio.ensure_future(engine.run())
+    try:
+        # Warm up: every account logged in, loaded its kids and backfilled the fixture history
+        if not await _wait_for(lambda: server.requests["kids"] >= accounts, args.timeout):
+            raise RuntimeError(f"Only {server.requests['kids']} of {accounts} accounts started within {args.timeout} seconds")
+        await asyncio.sleep(args.poll_interval)
+
+        # Steady state throughput, nothing changes on the server meanwhile
+        polls_before = server.requests["presences"]
+        await asyncio.sleep(args.measure_seconds)
+        polls_per_second = (server.requests["presences"] - polls_before) / args.measure_seconds
+
+        requests_before = server.total_requests()
+        started = time.time()
+        presence_ids = {server.check_in(f"kid-{index}"): index for index in range(accounts)}
+
+        def delivered():
+            sends = [entry for entry in _read_signal_log(signal_log, started) if entry["event"] == "send"]
+            return sends if len({r for entry in sends for r in entry["recipients"] if r not in entry["failed"]}) >= accounts else None
+
+        await _wait_for(delivered, args.timeout, interval=0.25)
+        elapsed = time.time() - started
+        requests = server.total_requests() - requests_before
+    finally:
+        engine_task.cancel()
+        try:
+            await engine_task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    entries = _read_signal_log(signal_log, started)
+    first_send = {}
+    for entry in entries:
+        if entry["event"] != "send":
+            continue
+        for recipient in entry["recipients"]:
+            if recipient not in entry["failed"]:
+                first_send.setdefault(recipient, entry["time"])
+    latencies = sorted(
+        first_send[_recipient(index)] - server.changed_at[presence_id]
+        for presence_id, index in presence_ids.items() if _recipient(index) in first_send
+    )
+    events = len(latencies)
+    launches = sum(1 for entry in entries if entry["event"] == "launch")
+    return {
+        "accounts": accounts,
+        "events": events,
+        "delivered_ratio": events / accounts,
+        "elapsed": elapsed,
+        "polls_per_second": polls_per_second,
+        "latency_p50": statistics.median(latencies) if latencies else None,
+        "latency_p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else None,
+        "latency_max": latencies[-1] if latencies else None,
+        "requests_per_event": requests / events if events else None,
+        "launches_per_event": launches / events if events else None,
+    }
+
+
+def run_scenario(accounts: int, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"hortpwn-bench-{accounts}-")
+    signal_log = os.path.join(workdir, "signal.jsonl")
+    os.environ.update({
+        "FAKE_SIGNAL_LOG": signal_log,
+        "FAKE_SIGNAL_STARTUP": str(args.signal_startup),
+        "FAKE_SIGNAL_LATENCY": str(args.signal_latency),
+        "FAKE_SIGNAL_ERROR_RATE": str(args.signal_error_rate),
+    })
+
+    server = FakeHortPro(latency=args.server_latency)
+    fixture_rows = load_fixture_rows(args.fixture) if args.fixture and os.path.exists(args.fixture) else []
+    configs = _write_setup(workdir, accounts)
+    for index, account in enumerate(configs):
+        kid_id = f"kid-{index}"
+        server.add_account(account.email, account.password, [{"id": kid_id, "firstname": f"Kid{index}"}])
+        # Presence ids are unique across kids, like they are in HortPro
+        server.set_presences(kid_id, [{**row, "id": f"{index}-{row['id']}"} for row in fixture_rows])
+    server.start()
+
+    sender = SignalSender(FAKE_SIGNAL_CLI, "+4900000000", backend=args.signal_backend, send_timeout=args.timeout)
+    sender.start()
+    dispatcher = NotificationDispatcher(sender.send, path=os.path.join(workdir, "outbox.db"), workers=args.workers,
+                                        base_delay=1)
+    dispatcher.start()
+    engine = PollingEngine(
+        configs,
+        dispatcher.enqueue,
+        poll_interval=args.poll_interval,
+        polling={"min_interval": args.poll_interval, "max_interval": args.poll_interval},
+        max_concurrent_requests=args.concurrency,
+        requests_per_second=args.requests_per_second,
+        request_timeout=args.timeout,
+        history_path=os.path.join(workdir, "presences.db"),
+        base_url=server.url,
+    )
+    try:
+        return asyncio.run(_measure(engine, server, accounts, signal_log, args))
+    finally:
+        dispatcher.stop()
+        sender.stop()
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance: float) -> list:
+    regressions = []
+    previous = {result["accounts"]: result for result in baseline}
+    for result in results:
+        old = previous.get(result["accounts"])
+        if not old:
+            continue
+        for metric in LOWER_IS_BETTER:
+            if result[metric] is not None and old.get(metric) and result[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{result['accounts']} accounts: {metric} {old[metric]:.3f} -> {result[metric]:.3f}")
+        if result["delivered_ratio"] < old.get("delivered_ratio", 0):
+            regressions.append(f"{result['accounts']} accounts: delivered {old['delivered_ratio']:.0%} -> {result['delivered_ratio']:.0%}")
+    return regressions
+
+
+def _format(value, spec: str = ".3f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1, 10, 1000])
+    parser.add_argument("--poll-interval", type=float, default=1)
+    parser.add_argument("--measure-seconds", type=float, default=5, help="steady state window for the poll throughput")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests-per-second", type=float, default=2000)
+    parser.add_argument("--workers", type=int, default=2, help="dispatcher workers")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for warm-up and for delivery")
+    parser.add_argument("--server-latency", type=float, default=0, help="seconds added to every HortPro response")
+    parser.add_argument("--signal-backend", choices=("daemon", "subprocess"), default="daemon")
+    parser.add_argument("--signal-startup", type=float, default=0, help="seconds every signal-cli launch takes")
+    parser.add_argument("--signal-latency", type=float, default=0, help="seconds every send takes")
+    parser.add_argument("--signal-error-rate", type=float, default=0)
+    parser.add_argument("--fixture", default=FIXTURE, help="captured presence rows every kid starts with")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run, exit with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--keep", action="store_true", help="keep the temporary working directories")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    setup_logging({"level": args.log_level, "file": None})
+    results = []
+    print(f"{'accounts':>8} {'events':>7} {'polls/s':>9} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'req/event':>10} {'launch/event':>13}")
+    for accounts in args.accounts:
+        result = run_scenario(accounts, args)
+        results.append(result)
+        print(f"{accounts:>8} {result['events']:>7} {_format(result['polls_per_second'], '.1f'):>9} "
+              f"{_format(result['latency_p50']):>8} {_format(result['latency_p95']):>8} {_format(result['latency_max']):>8} "
+              f"{_format(result['requests_per_event'], '.2f'):>10} {_format(result['launches_per_event'], '.2f'):>13}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
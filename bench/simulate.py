@@ -0,0 +1,276 @@
+# bench/simulate.py
+"""Runs the polling engine on a virtual clock over weeks of generated or replayed presences.
+
+    python -m bench.simulate --days 28 --accounts 10
+    python -m bench.simulate --rows test.json --schedule scheduler.csv
+
+A simulated month takes seconds: the engine, schedule, monitor and poll scheduler all read the
+virtual clock, and the event loop jumps from one wake-up to the next instead of sleeping.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from bench.fake_hortpro import load_fixture_rows
+from clock import InlineExecutor, VirtualClock, VirtualEventLoop
+from engine import PollingEngine
+from logconfig import setup_logging
+from models import AccountConfig
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).astimezone().isoformat(timespec="seconds")
+
+
+def generate_timeline(first_day: date, days: int, rng: random.Random, closures=()) -> list:
+    """One presence per school day: arrival around noon, pickup three to four hours later."""
+    timeline = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        if day.weekday() >= 5 or day in closures:
+            continue
+        arrival = datetime.combine(day, datetime.min.time()).replace(hour=12) + timedelta(minutes=rng.gauss(0, 40))
+        pickup = arrival + timedelta(minutes=max(30, rng.gauss(210, 60)))
+        timeline.append({"id": f"{day.isoformat()}-{rng.getrandbits(32):08x}", "start": arrival.timestamp(), "end": pickup.timestamp()})
+    return timeline
+
+
+def replay_timeline(rows: list, first_day: date) -> list:
+    """Captured rows moved to the simulated days, keeping their weekday and time of day."""
+    if not rows:
+        return []
+    starts = [datetime.fromisoformat(row["date_start"]) for row in rows]
+    oldest = min(starts).date()
+    # Whole weeks, so a Monday stays a Monday
+    shift = timedelta(days=((first_day - oldest).days // 7 + 1) * 7)
+    timeline = []
+    for row, start in zip(rows, starts):
+        end = datetime.fromisoformat(row["date_end"]) if row.get("date_end") else None
+        timeline.append({
+            "id": row["id"],
+            "start": (start + shift).timestamp(),
+            "end": (end + shift).timestamp() if end else None,
+        })
+    return timeline
+
+
+class SimulatedHortApi:
+    """Answers like HortApi, with the presences of one kid as they look at the virtual time."""
+
+    def __init__(self, clock: VirtualClock, kid: dict, timeline: list):
+        self.clock = clock
+        self.kid = kid
+        self.timeline = sorted(timeline, key=lambda presence: presence["start"], reverse=True)
+        self.requests = 0
+
+    def get_kids(self, refresh: bool = False):
+        self.requests += 1
+        return [self.kid]
+
+    def get_presences(self, kid_id: str, start: int = 0, limit: int = 5):
+        self.requests += 1
+        now = self.clock.time()
+        rows = []
+        for presence in self.timeline:
+            if presence["start"] > now:
+                continue
+            ended = presence["end"] is not None and presence["end"] <= now
+            rows.append({
+                "id": presence["id"],
+                "date_start": _iso(presence["start"]),
+                "date_end": _iso(presence["end"]) if ended else None,
+                "duration": int((presence["end"] - presence["start"]) // 60) if ended else None,
+            })
+        return {"count": len(rows), "rows": rows[start:start + limit]}
+
+
+class Recorder:
+    """send_message replacement that remembers when each message went out."""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.sent = defaultdict(list)
+        self.messages = 0
+
+    def send(self, recipients, recipient_type, message):
+        # One message can carry several events, merged by the notification policy
+        kinds = []
+        for line in message.splitlines():
+            if line.startswith("Correction"):
+                kinds.append("correction")
+                continue
+            if "since" in line or "arrived" in line:
+                kinds.append("check_in")
+            if "left" in line:
+                kinds.append("check_out")
+        for recipient in recipients:
+            self.sent[recipient].extend((self.clock.time(), kind) for kind in kinds)
+        self.messages += len(recipients)
+        return True
+
+
+def evaluate(engine, recorder: Recorder, timelines: dict) -> dict:
+    expected = defaultdict(list)
+    for recipient, timeline in timelines.items():
+        for presence in timeline:
+            expected[(recipient, date.fromtimestamp(presence["start"]), "check_in")].append(presence["start"])
+            if presence["end"] is not None:
+                expected[(recipient, date.fromtimestamp(presence["start"]), "check_out")].append(presence["end"])
+    sent = defaultdict(list)
+    for recipient, messages in recorder.sent.items():
+        for sent_at, kind in messages:
+            sent[(recipient, date.fromtimestamp(sent_at), kind)].append(sent_at)
+
+    schedule = engine.accounts[0].schedule
+    latencies, missed, missed_in_window, duplicates, unexpected = [], 0, 0, 0, 0
+    for key in expected.keys() | sent.keys():
+        happened, notified = sorted(expected.get(key, [])), sorted(sent.get(key, []))
+        if key[2] == "correction":
+            continue
+        if not happened:
+            unexpected += len(notified)
+            continue
+        duplicates += max(0, len(notified) - len(happened))
+        for event_time, sent_at in zip(happened, notified):
+            latencies.append(sent_at - event_time)
+        for event_time in happened[len(notified):]:
+            missed += 1
+            if schedule.window_end(datetime.fromtimestamp(event_time)):
+                missed_in_window += 1
+    latencies.sort()
+    return {
+        "events": sum(len(times) for times in expected.values()),
+        "notified": len(latencies),
+        "missed": missed,
+        "missed_in_window": missed_in_window,
+        "duplicates": duplicates,
+        "unexpected": unexpected,
+        "latency_p50": statistics.median(latencies) if latencies else None,
+        "latency_p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else None,
+        "latency_max": latencies[-1] if latencies else None,
+    }
+
+
+async def _run_for(engine, seconds: float):
+    try:
+        await asyncio.wait_for(engine.run(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def simulate(args) -> dict:
+    first_day = date.fromisoformat(args.start) if args.start else date.today() - timedelta(days=date.today().weekday())
+    clock = VirtualClock(datetime.combine(first_day, datetime.min.time()))
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="hortpwn-sim-")
+
+    configs, timelines = [], {}
+    replayed = load_fixture_rows(args.rows) if args.rows else None
+    for index in range(args.accounts):
+        recipient = f"+4915{index:08d}"
+        chat_ids_path = os.path.join(workdir, f"chat_ids_{index}.json")
+        with open(chat_ids_path, "w") as f:
+            json.dump([{"id": recipient, "type": "individual"}], f)
+        configs.append(AccountConfig(
+            name=f"sim{index}",
+            email=f"parent{index}@sim.local",
+            password="-",
+            cookie_path=os.path.join(workdir, f"cookie_{index}.txt"),
+            chat_ids_path=chat_ids_path,
+            schedule_file=args.schedule,
+            closures_file=args.closures,
+            state_path=os.path.join(workdir, f"notifications_sent_{index}.json"),
+        ))
+        if replayed is not None:
+            timeline = [{**presence, "id": f"{index}-{presence['id']}"} for presence in replay_timeline(replayed, first_day)]
+        else:
+            timeline = generate_timeline(first_day, args.days, rng)
+        timelines[recipient] = [presence for presence in timeline if presence["start"] < clock.time() + args.days * 86400]
+
+    recorder = Recorder(clock)
+    engine = PollingEngine(
+        configs,
+        recorder.send,
+        poll_interval=args.poll_interval,
+        polling={"min_interval": args.min_interval, "max_interval": args.max_interval},
+        requests_per_second=0,
+        history_path=os.path.join(workdir, "presences.db"),
+        clock=clock,
+    )
+    # Everything runs on the loop's thread, otherwise virtual time would run ahead of the workers
+    engine.http_executor.shutdown()
+    engine.process_executor.shutdown()
+    engine.http_executor = engine.process_executor = InlineExecutor()
+    apis = []
+    for index, (task, recipient) in enumerate(zip(engine.accounts, timelines)):
+        api = SimulatedHortApi(clock, {"id": f"kid-{index}", "firstname": f"Kid{index}"}, timelines[recipient])
+        task.hort_api = task.monitor.hort_api = api
+        apis.append(api)
+
+    started = time.monotonic()
+    loop = VirtualEventLoop(clock)
+    try:
+        loop.run_until_complete(_run_for(engine, args.days * 86400))
+    finally:
+        loop.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = evaluate(engine, recorder, timelines)
+    result.update({
+        "days": args.days,
+        "accounts": args.accounts,
+        "wall_seconds": time.monotonic() - started,
+        "requests": sum(api.requests for api in apis),
+        "messages": recorder.messages,
+    })
+    result["requests_per_account_day"] = result["requests"] / args.accounts / args.days
+    return result
+
+
+def _format(value, spec: str = ".0f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--accounts", type=int, default=1)
+    parser.add_argument("--start", help="first simulated day (YYYY-MM-DD), the Monday of this week by default")
+    parser.add_argument("--schedule", default="scheduler.csv")
+    parser.add_argument("--closures", help="closure days file, like closures_file in config.json")
+    parser.add_argument("--rows", help="replay captured presences (app.log like test.json, or JSON rows)")
+    parser.add_argument("--poll-interval", type=float, default=60)
+    parser.add_argument("--min-interval", type=float, help="hot zone interval, the poll interval by default")
+    parser.add_argument("--max-interval", type=float, default=900)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the result to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    setup_logging({"level": args.log_level, "file": None})
+    result = simulate(args)
+    print(f"Simulated {result['days']} days for {result['accounts']} account(s) in {result['wall_seconds']:.1f} s wall time")
+    print(f"HortPro requests: {result['requests']} ({result['requests_per_account_day']:.1f} per account per day)")
+    print(f"Notifications: {result['notified']} of {result['events']} events in {result['messages']} messages, {result['missed']} missed "
+          f"({result['missed_in_window']} inside a window), {result['duplicates']} duplicates, {result['unexpected']} unexpected")
+    print(f"Detection latency: p50 {_format(result['latency_p50'])} s, p95 {_format(result['latency_p95'])} s, "
+          f"max {_format(result['latency_max'])} s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    # Missed events outside the windows are expected, sending twice or inventing events is not
+    return 1 if result["duplicates"] or result["unexpected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# clock.py
+
+import asyncio
+import selectors
+import time
+from concurrent.futures import Executor, Future
+from datetime import datetime
+
+
+class Clock:
+    """Wall clock time, what everything uses unless a simulation passes a VirtualClock."""
+
+    def now(self, tz=None) -> datetime:
+        return datetime.now(tz)
+
+    def time(self) -> float:
+        return time.time()
+
+
+SYSTEM_CLOCK = Clock()
+
+
+class VirtualClock(Clock):
+    """Simulated time that only moves when it is advanced, by hand or by a VirtualEventLoop."""
+
+    def __init__(self, start: datetime):
+        self._time = start.timestamp()
+
+    def now(self, tz=None) -> datetime:
+        # Same semantics as datetime.now(): naive local time without a zone
+        return datetime.fromtimestamp(self._time, tz)
+
+    def time(self) -> float:
+        return self._time
+
+    def advance(self, seconds: float):
+        if seconds > 0:
+            self._time += seconds
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    # Instead of blocking until the next timer is due, the loop jumps straight to it
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout is None:
+            return events or super().select(None)
+        # A microsecond past the timer, the loop only runs timers that are due by more than its clock resolution
+        self.clock.advance(timeout + 1e-6)
+        return events
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """asyncio loop on a VirtualClock: sleeps, timeouts and call_later take no wall time at all.
+
+    Only correct if nothing runs outside the loop, so executors have to be InlineExecutors.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        super().__init__(selector=_VirtualSelector(clock))
+
+    def time(self) -> float:
+        return self.clock.time()
+
+
+class InlineExecutor(Executor):
+    """Runs every submitted call right away on the calling thread."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
@@ -0,0 +1,60 @@
+# diff.py
+
+import logging
+from datetime import date
+from typing import List
+from models import CheckIn, CheckOut, Corrected, PresenceEvent, Removed
+
+logger = logging.getLogger(__name__)
+
+# Rows of the previous snapshot that are seeded from the history store
+SEED_SIZE = 10
+
+
+class PresenceDiff:
+    """Compares each presences payload with the previous one by presence id and emits what changed."""
+
+    def __init__(self, history):
+        self.history = history
+        self.snapshots = {}
+
+    def _seed(self, kid_id: str, today: date) -> dict:
+        # Today's rows are left out on purpose, so after a restart they come up as new events once.
+        # NotificationState then filters out the notifications that were already sent.
+        rows = self.history.recent(kid_id, SEED_SIZE)
+        return {row["id"]: row for row in rows if row["day"] != today.isoformat()}
+
+    def diff(self, kid_id: str, rows: List[dict], today: date) -> List[PresenceEvent]:
+        previous = self.snapshots.get(kid_id)
+        if previous is None:
+            previous = self._seed(kid_id, today)
+        current = {row["id"]: row for row in rows if row.get("id") and row.get("date_start")}
+        # An empty payload says nothing about the rows we know, keep the old snapshot
+        self.snapshots[kid_id] = current or previous
+
+        events = []
+        for presence_id, row in current.items():
+            old = previous.get(presence_id)
+            start, end = row["date_start"], row.get("date_end")
+            if old is None:
+                events.append(CheckIn(kid_id, presence_id, start, end))
+                if end:
+                    events.append(CheckOut(kid_id, presence_id, start, end))
+                continue
+            if old.get("date_start") != start:
+                events.append(Corrected(kid_id, presence_id, start, end, field="date_start", old_value=old.get("date_start")))
+            if end and not old.get("date_end"):
+                events.append(CheckOut(kid_id, presence_id, start, end))
+            elif end != old.get("date_end"):
+                events.append(Corrected(kid_id, presence_id, start, end, field="date_end", old_value=old.get("date_end")))
+
+        # Rows older than the oldest one on the page have just scrolled off it, they are not removed
+        if current:
+            oldest = min(row["date_start"] for row in current.values())
+            for presence_id, old in previous.items():
+                if presence_id not in current and old["date_start"] >= oldest:
+                    events.append(Removed(kid_id, presence_id, old["date_start"], old.get("date_end")))
+
+        if events:
+            logger.debug(f"Presence changes for kid {kid_id}: {[event.kind for event in events]}")
+        return events
@@ -0,0 +1,201 @@
+# dispatcher.py
+
+import heapq
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipients TEXT NOT NULL,
+    recipient_type TEXT NOT NULL,
+    message TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, next_attempt);
+"""
+
+
+class NotificationDispatcher:
+    """Persistent outbox with a worker pool, so sending never holds up polling."""
+
+    def __init__(self, send, path: str = "outbox.db", workers: int = 2, max_queue: int = 1000,
+                 max_attempts: int = 6, base_delay: float = 5, max_delay: float = 600):
+        self.send = send
+        self.path = path
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []
+        # Queued or currently being sent, so a refill from the outbox never picks them up twice
+        self._tracked = set()
+        self._overflow = False
+        self._cond = threading.Condition()
+        self._db_lock = threading.Lock()
+        self._threads = []
+        self._stopping = False
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        # Outboxes from before batched sends have a single "recipient" per row
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(outbox)")]
+        if "recipient" in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE outbox RENAME COLUMN recipient TO recipients")
+                self._conn.execute("UPDATE outbox SET recipients = json_array(recipients)")
+
+    def start(self):
+        self._stopping = False
+        self._refill()
+        pending = len(self._heap)
+        if pending:
+            logger.info(f"Resuming {pending} undelivered notification(s) from '{self.path}'.")
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"dispatcher-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, recipients: List[str], recipient_type: str, message: str) -> bool:
+        now = time.time()
+        with self._db_lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (recipients, recipient_type, message, next_attempt, created) VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(list(recipients)), recipient_type, message, now, now),
+            )
+        self._push(cursor.lastrowid, now)
+        logger.debug(f"Queued message to {', '.join(recipients)}: {message}")
+        return True
+
+    def _push(self, outbox_id: int, next_attempt: float):
+        with self._cond:
+            if outbox_id in self._tracked:
+                return
+            # The outbox row is safe on disk, a full queue only delays it until the workers catch up
+            if len(self._heap) >= self.max_queue:
+                if not self._overflow:
+                    logger.warning("Notification queue is full, new messages stay in the outbox for now.")
+                self._overflow = True
+                return
+            heapq.heappush(self._heap, (next_attempt, outbox_id))
+            self._tracked.add(outbox_id)
+            self._cond.notify()
+
+    def _refill(self):
+        with self._cond:
+            self._overflow = False
+            limit = self.max_queue + len(self._tracked)
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT id, next_attempt FROM outbox WHERE status = 'pending' ORDER BY next_attempt LIMIT ?",
+                (limit,),
+            ).fetchall()
+        for row in rows:
+            self._push(row["id"], row["next_attempt"])
+        if len(rows) == limit:
+            # There may be more pending rows than we looked at
+            with self._cond:
+                self._overflow = True
+
+    def _next(self):
+        with self._cond:
+            while not self._stopping:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                next_attempt, outbox_id = self._heap[0]
+                delay = next_attempt - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                return outbox_id
+        return None
+
+    def _work(self):
+        while True:
+            outbox_id = self._next()
+            if outbox_id is None:
+                return
+            with self._db_lock:
+                row = self._conn.execute("SELECT * FROM outbox WHERE id = ? AND status = 'pending'", (outbox_id,)).fetchone()
+            next_attempt = None
+            if row is not None:
+                next_attempt = self._deliver(row)
+
+            with self._cond:
+                self._tracked.discard(outbox_id)
+                refill = self._overflow and len(self._heap) < self.max_queue // 2
+            if next_attempt is not None:
+                self._push(outbox_id, next_attempt)
+            if refill:
+                self._refill()
+
+    def _deliver(self, row):
+        recipients = json.loads(row["recipients"])
+        try:
+            failed = self.send(recipients, row["recipient_type"], row["message"])
+            error = "send failed"
+        except Exception as e:
+            failed, error = recipients, str(e)
+
+        if not failed:
+            with self._db_lock, self._conn:
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (row["id"],))
+            return None
+        # Only the recipients that didn't get the message are tried again
+        return self._retry_later(row, failed, error)
+
+    def _retry_later(self, row, failed: List[str], error: str):
+        attempts = row["attempts"] + 1
+        recipients = ", ".join(failed)
+        if attempts >= self.max_attempts:
+            with self._db_lock, self._conn:
+                self._conn.execute(
+                    "UPDATE outbox SET status = 'dead', recipients = ?, attempts = ?, last_error = ? WHERE id = ?",
+                    (json.dumps(failed), attempts, error, row["id"]),
+                )
+            logger.error(f"Giving up on message to {recipients} after {attempts} attempts: {error}")
+            return None
+
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        next_attempt = time.time() + delay * random.uniform(0.8, 1.2)
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET recipients = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (json.dumps(failed), attempts, next_attempt, error, row["id"]),
+            )
+        logger.warning(f"Message to {recipients} failed ({error}), retry {attempts} in {int(delay)} seconds.")
+        return next_attempt
+
+    def dead_letters(self) -> List[dict]:
+        with self._db_lock:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM outbox WHERE status = 'dead' ORDER BY created")]
+
+    def pending_count(self) -> int:
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def stop(self, timeout: float = 10):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
@@ -0,0 +1,282 @@
+# engine.py
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from clock import SYSTEM_CLOCK, Clock
+from typing import List
+from requests.adapters import HTTPAdapter
+from hortapi import HortApi
+from models import AccountConfig
+from monitor import AccountMonitor
+from history import PresenceHistory
+from metrics import POLLS, POLLS_PER_WINDOW, POLL_SECONDS
+from policy import NotificationPolicy, TokenBucket
+from polling import AdaptivePollScheduler
+from recipients import RecipientRegistry
+from schedule import load_schedule
+from transport import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+def load_accounts(config: dict, cookie_path: str = "cookie.txt") -> List[AccountConfig]:
+    closures_file = config.get("closures_file")
+    # Legacy configs have a single top level "hortpro_login" instead of an "accounts" list
+    if "accounts" not in config:
+        login = config.get("hortpro_login", {})
+        return [AccountConfig(name="default", email=login.get("email"), password=login.get("password"),
+                              cookie_path=cookie_path, closures_file=closures_file)]
+
+    accounts = []
+    for index, entry in enumerate(config["accounts"]):
+        name = entry.get("name") or f"account{index + 1}"
+        login = entry.get("hortpro_login", {})
+        if not login.get("email") or not login.get("password"):
+            logger.error(f"Account '{name}' is missing 'hortpro_login.email' or 'hortpro_login.password'. Skipping it.")
+            continue
+        accounts.append(AccountConfig(
+            name=name,
+            email=login["email"],
+            password=login["password"],
+            cookie_path=entry.get("cookie_path", f"cookie_{name}.txt"),
+            chat_ids_path=entry.get("chat_ids_path", f"chat_ids_{name}.json"),
+            schedule_file=entry.get("schedule_file", "scheduler.csv"),
+            closures_file=entry.get("closures_file", closures_file),
+            state_path=entry.get("state_path", f"notifications_sent_{name}.json"),
+        ))
+    return accounts
+
+
+class RateLimiter:
+    """Token bucket shared by all account tasks, a rate of 0 disables it."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.bucket = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                # The loop's clock, so a simulation on virtual time is rate limited the same way
+                now = loop.time()
+                if self.bucket is None:
+                    self.bucket = TokenBucket(self.rate, self.burst, now)
+                if self.bucket.ready(now):
+                    self.bucket.take(now)
+                    return
+                await asyncio.sleep(self.bucket.wait_time(now))
+
+
+class AccountTask:
+    def __init__(self, engine, account: AccountConfig):
+        self.engine = engine
+        self.account = account
+        self.name = account.name
+        self.hort_api = HortApi(email=account.email, password=account.password, cookie_path=account.cookie_path,
+                                adapter=engine.adapter, base_url=engine.base_url, name=account.name,
+                                transport=engine.transport)
+        # Picks up edits of the recipients file without a restart
+        self.monitor = AccountMonitor(account.name, self.hort_api, engine.history, RecipientRegistry(account.chat_ids_path),
+                                      engine.send_message, account.state_path, clock=engine.clock,
+                                      policy=engine.policy, flush=engine.flush_and_save)
+        self.schedule = load_schedule(account.schedule_file, account.closures_file, engine.timezone, clock=engine.clock)
+        self.poll_scheduler = AdaptivePollScheduler(engine.history, base_interval=engine.poll_interval, clock=engine.clock,
+                                                    **engine.polling)
+        self.semaphore = None
+        self.window_polls = 0
+
+    async def call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        await self.semaphore.acquire()
+        try:
+            await self.engine.rate_limiter.acquire()
+            await self.engine.request_slots.acquire()
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+        def release(future):
+            self.engine.request_slots.release()
+            self.semaphore.release()
+            if not future.cancelled():
+                future.exception()
+
+        future = loop.run_in_executor(self.engine.http_executor, fn, *args)
+        # Slots are only given back once the request has really finished, so a hung account
+        # holds at most requests_per_account of them while the other accounts keep going
+        future.add_done_callback(release)
+        return await asyncio.wait_for(asyncio.shield(future), self.engine.request_timeout)
+
+    async def poll(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        kids = self.monitor.kids
+        results = await asyncio.gather(*(self.call(self.hort_api.get_presences, kid.id) for kid in kids), return_exceptions=True)
+        all_presences = {}
+        circuit_open = None
+        for kid, result in zip(kids, results):
+            if isinstance(result, CircuitOpenError):
+                circuit_open = result
+            elif isinstance(result, asyncio.TimeoutError):
+                logger.error(f"[{self.name}] Timeout retrieving presence data for kid {kid.id}.")
+            elif isinstance(result, Exception):
+                logger.error(f"[{self.name}] Error retrieving presence data for kid {kid.id}: {result}")
+            else:
+                all_presences[kid.id] = result
+        changed_rows = await loop.run_in_executor(self.engine.process_executor, self.monitor.process_presences, all_presences)
+
+        # A poll only sees the newest page, if all of it was new there may be more we missed
+        for kid_id, changed in changed_rows.items():
+            if changed and changed >= len(all_presences[kid_id].get("rows", [])):
+                await self.sync_history(kid_id)
+        self.window_polls += 1
+        POLLS.inc(account=self.name)
+        POLL_SECONDS.observe(loop.time() - started, account=self.name)
+        if circuit_open:
+            raise circuit_open
+
+    async def load_kids(self):
+        # Fetched again at every window start, so kids added to or removed from the account are picked up
+        kids = await self.call(self.monitor.load_kids, True)
+        # Backfills the full history the first time, afterwards only fetches pages we don't know yet
+        for kid in kids:
+            await self.sync_history(kid.id)
+
+    async def sync_history(self, kid_id: str):
+        # One call per page, so a long backfill takes a rate token per request and no page hits the request timeout
+        start = 0
+        while start is not None:
+            page = await self.call(self.engine.history.sync_page, self.hort_api, kid_id, start)
+            if page is None:
+                return
+            start = page[1]
+
+    async def run(self):
+        self.semaphore = asyncio.Semaphore(self.engine.requests_per_account)
+        in_window = False
+        while True:
+            try:
+                now = self.schedule.now()
+                window_end = self.schedule.window_end(now)
+                if window_end and (window_end - now).total_seconds() < 1:
+                    # Woke up a hair before the window closes, don't start another poll
+                    await asyncio.sleep((window_end - now).total_seconds())
+                    continue
+                if window_end:
+                    if not in_window or not self.monitor.kids:
+                        await self.load_kids()
+                    in_window = True
+
+                    interval = self.engine.poll_interval
+                    if self.monitor.kids:
+                        await self.poll()
+                        interval = self.poll_scheduler.next_interval([kid.id for kid in self.monitor.kids])
+                    else:
+                        logger.error(f"[{self.name}] No child found. Skipping this poll.")
+
+                    # Sleep until the next poll or the end of the window, whichever comes first
+                    until_window_end = (window_end - self.schedule.now()).total_seconds()
+                    logger.info(f"[{self.name}] Sleeping for {int(min(interval, until_window_end))} seconds before the next scrape.")
+                    await asyncio.sleep(max(min(interval, until_window_end), 0))
+                else:
+                    if in_window:
+                        POLLS_PER_WINDOW.observe(self.window_polls, account=self.name)
+                        self.window_polls = 0
+                    in_window = False
+                    next_window_start = self.schedule.next_window_start(now)
+                    if next_window_start:
+                        sleep_seconds = (next_window_start - now).total_seconds()
+                        logger.info(f"[{self.name}] Outside time windows. Sleeping until next window at {next_window_start.strftime('%Y-%m-%d %H:%M')}. ({int(sleep_seconds)} seconds)")
+                        await asyncio.sleep(max(sleep_seconds, 0))
+                    else:
+                        logger.info(f"[{self.name}] No scheduled windows found. Sleeping for 1 hour.")
+                        await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                raise
+            except CircuitOpenError as e:
+                # HortPro is failing for everybody, wait for the breaker instead of polling at full rate
+                logger.warning(f"[{self.name}] {e}.")
+                await asyncio.sleep(max(e.retry_in, 1))
+            except asyncio.TimeoutError:
+                logger.error(f"[{self.name}] Request to HortPro timed out.")
+                await asyncio.sleep(60)
+            except Exception as e:
+                logger.error(f"[{self.name}] Error in account loop: {e}")
+                await asyncio.sleep(60)
+
+
+class PollingEngine:
+    """Runs every account as an independent asyncio task on shared HTTP and send workers."""
+
+    def __init__(self, accounts: List[AccountConfig], send_message, poll_interval: float = 60,
+                 max_concurrent_requests: int = 8, requests_per_second: float = 5, requests_per_account: int = 2,
+                 request_timeout: float = 60, process_workers: int = 4, polling: dict = None,
+                 history_path: str = "presences.db", timezone: str = None,
+                 base_url: str = "https://elternportal.hortpro.de", clock: Clock = SYSTEM_CLOCK,
+                 transport: dict = None, notifications: dict = None):
+        self.send_message = send_message
+        # Only a simulation passes its own clock, see bench/simulate.py
+        self.clock = clock
+        self.timezone = timezone
+        self.base_url = base_url
+        self.history = PresenceHistory(history_path)
+        self.poll_interval = poll_interval
+        self.polling = polling or {}
+        self.transport = transport or {}
+        self.max_concurrent_requests = max_concurrent_requests
+        self.requests_per_second = requests_per_second
+        self.requests_per_account = requests_per_account
+        self.request_timeout = request_timeout
+        # One connection pool for all accounts, cookies stay separate in each account's session
+        self.adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_concurrent_requests)
+        self.http_executor = ThreadPoolExecutor(max_workers=max_concurrent_requests, thread_name_prefix="hortapi")
+        self.process_executor = ThreadPoolExecutor(max_workers=process_workers, thread_name_prefix="process")
+        self.rate_limiter = None
+        self.request_slots = None
+        # Merges and rate limits the notifications of all accounts before they reach send_message
+        self.policy = NotificationPolicy(send_message, clock=clock, **(notifications or {}))
+        self.accounts = [AccountTask(self, account) for account in accounts]
+
+    def status_for(self, recipient: str) -> List[str]:
+        return [line for account in self.accounts for line in account.monitor.status_lines(recipient)]
+
+    async def flush_notifications(self):
+        # Polls flush right away, this only sends what a rate limit held back
+        loop = asyncio.get_running_loop()
+        while True:
+            ready_in = self.policy.ready_in()
+            await asyncio.sleep(60 if ready_in is None else min(max(ready_in, 1), 60))
+            if self.policy.has_pending():
+                try:
+                    await loop.run_in_executor(self.process_executor, self.flush_and_save)
+                except Exception as e:
+                    logger.error(f"Error flushing notifications: {e}")
+
+    def flush_and_save(self) -> int:
+        sends = self.policy.flush()
+        if sends:
+            # Sent notifications are marked in their account's state, only changed states touch the disk
+            for account in self.accounts:
+                account.monitor.state.save()
+        return sends
+
+    async def run(self):
+        self.rate_limiter = RateLimiter(self.requests_per_second, burst=self.max_concurrent_requests)
+        self.request_slots = asyncio.Semaphore(self.max_concurrent_requests)
+        logger.info(f"Starting polling engine for {len(self.accounts)} account(s).")
+        tasks = [asyncio.ensure_future(account.run()) for account in self.accounts]
+        tasks.append(asyncio.ensure_future(self.flush_notifications()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.http_executor.shutdown(wait=False)
+            self.process_executor.shutdown(wait=False)
+            self.history.close()
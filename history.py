@@ -0,0 +1,161 @@
+# history.py
+
+import logging
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_PAGE_SIZE = 50
+INCREMENTAL_PAGE_SIZE = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS presences (
+    id TEXT PRIMARY KEY,
+    kid_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    date_start TEXT,
+    date_end TEXT,
+    duration INTEGER
+);
+CREATE INDEX IF NOT EXISTS presences_kid_day ON presences (kid_id, day);
+CREATE TABLE IF NOT EXISTS sync_state (
+    kid_id TEXT PRIMARY KEY,
+    backfilled INTEGER NOT NULL DEFAULT 0,
+    total_count INTEGER
+);
+"""
+
+COLUMNS = "id, kid_id, day, date_start, date_end, duration"
+
+
+class PresenceHistory:
+    """Local SQLite copy of the presences of all kids, keyed by presence id."""
+
+    def __init__(self, path: str = "presences.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def store(self, kid_id: str, rows: List[dict]) -> int:
+        """Insert or update presence rows, returns how many were new or changed."""
+        records = []
+        for row in rows:
+            if not row.get("id") or not row.get("date_start"):
+                continue
+            day = datetime.fromisoformat(row["date_start"]).date().isoformat()
+            records.append((row["id"], kid_id, day, row["date_start"], row.get("date_end"), row.get("duration")))
+        if not records:
+            return 0
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                f"INSERT INTO presences ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET day = excluded.day, date_start = excluded.date_start, "
+                "date_end = excluded.date_end, duration = excluded.duration "
+                "WHERE presences.date_start IS NOT excluded.date_start OR presences.date_end IS NOT excluded.date_end "
+                "OR presences.duration IS NOT excluded.duration",
+                records,
+            )
+            return self._conn.total_changes - before
+
+    def remove(self, presence_ids: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM presences WHERE id = ?", [(presence_id,) for presence_id in presence_ids])
+
+    def _query(self, sql: str, params=()) -> List[dict]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def rows_on(self, kid_id: str, day: date) -> List[dict]:
+        return self._query(
+            f"SELECT {COLUMNS} FROM presences WHERE kid_id = ? AND day = ? ORDER BY date_start DESC",
+            (kid_id, day.isoformat()),
+        )
+
+    def recent(self, kid_id: str, limit: int) -> List[dict]:
+        return self._query(
+            f"SELECT {COLUMNS} FROM presences WHERE kid_id = ? ORDER BY day DESC, date_start DESC LIMIT ?",
+            (kid_id, limit),
+        )
+
+    def between(self, kid_id: str, first_day: Optional[date] = None, last_day: Optional[date] = None) -> List[dict]:
+        return self._query(
+            f"SELECT {COLUMNS} FROM presences WHERE kid_id = ? AND day >= ? AND day <= ? ORDER BY day, date_start",
+            (kid_id, first_day.isoformat() if first_day else "", last_day.isoformat() if last_day else "9999"),
+        )
+
+    def kid_ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT kid_id FROM presences ORDER BY kid_id")]
+
+    def day_signatures(self, kid_id: str, first_day: Optional[date] = None, last_day: Optional[date] = None) -> dict:
+        """{day: (rows, last start, last end, total duration)}, changes whenever a presence of that day does."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT day, COUNT(*), MAX(date_start), MAX(date_end), SUM(duration) FROM presences "
+                "WHERE kid_id = ? AND day >= ? AND day <= ? GROUP BY day",
+                (kid_id, first_day.isoformat() if first_day else "", last_day.isoformat() if last_day else "9999"),
+            )
+            return {row[0]: tuple(row[1:]) for row in cursor}
+
+    def count(self, kid_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM presences WHERE kid_id = ?", (kid_id,)).fetchone()[0]
+
+    def is_backfilled(self, kid_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT backfilled FROM sync_state WHERE kid_id = ?", (kid_id,)).fetchone()
+        return bool(row and row["backfilled"])
+
+    def _mark_synced(self, kid_id: str, total_count: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state (kid_id, backfilled, total_count) VALUES (?, 1, ?) "
+                "ON CONFLICT(kid_id) DO UPDATE SET backfilled = 1, total_count = excluded.total_count",
+                (kid_id, total_count),
+            )
+
+    def sync_page(self, hort_api, kid_id: str, start: int = 0) -> Optional[Tuple[int, Optional[int]]]:
+        """Fetches and stores one page of a sync, returns (new or changed rows, start of the next page or None when done).
+
+        None if the page could not be fetched. Each page is its own request, so callers can rate limit them.
+        """
+        backfilled = self.is_backfilled(kid_id)
+        data = hort_api.get_presences(kid_id, start=start, limit=INCREMENTAL_PAGE_SIZE if backfilled else BACKFILL_PAGE_SIZE)
+        if data is None:
+            logger.warning(f"Presence sync for kid {kid_id} stopped at row {start}.")
+            return None
+        rows = data.get("rows", [])
+        total_count = data.get("count", 0)
+        changed = self.store(kid_id, rows)
+        next_start = start + len(rows)
+        # Rows come newest first, once a page contains known rows the rest is known as well
+        if rows and next_start < total_count and not (backfilled and changed < len(rows)):
+            return changed, next_start
+        self._mark_synced(kid_id, total_count)
+        if backfilled:
+            logger.debug(f"Presence sync for kid {kid_id} done at row {next_start}.")
+        else:
+            logger.info(f"Presence backfill for kid {kid_id} completed: {next_start} rows of {total_count}.")
+        return changed, None
+
+    def sync(self, hort_api, kid_id: str) -> int:
+        """Page through the kid's presences until the ones we already know, all of them the first time."""
+        start, new_rows = 0, 0
+        while start is not None:
+            page = self.sync_page(hort_api, kid_id, start)
+            if page is None:
+                break
+            changed, start = page
+            new_rows += changed
+        return new_rows
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
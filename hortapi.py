@@ -1,19 +1,43 @@
 # hortapi.py
 
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import List, Optional
 import json
 import logging
 import os
+import threading
+import time
+from urllib.parse import urlparse
+from logconfig import PayloadLog
+from metrics import HORTPRO_LOGINS, HORTPRO_REQUEST_SECONDS, HORTPRO_RESPONSES, HORTPRO_SESSIONS
+from transport import HttpTransport
+from utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
 
 class HortApi:
-    def __init__(self, email: str, password: str, cookie_path: str = "cookie.txt"):
+    def __init__(self, email: str, password: str, cookie_path: str = "cookie.txt", pool_size: int = 4,
+                 adapter: Optional[HTTPAdapter] = None, base_url: str = "https://elternportal.hortpro.de",
+                 name: str = "default", transport: Optional[dict] = None):
+        self.name = name
         self.email = email
         self.password = password
         self.cookie_path = cookie_path
         self.session = requests.Session()
-        self.login_url = "https://elternportal.hortpro.de/api/user/login"
-        self.base_api_url = "https://elternportal.hortpro.de/api"
+        # Several accounts can share one adapter, and with it one connection pool
+        adapter = adapter or HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Every request goes through here: timeouts, retries and the circuit breaker of the host
+        self.transport = HttpTransport(self.session, **(transport or {}))
+        self.base_url = base_url.rstrip("/")
+        self.login_url = f"{self.base_url}/api/user/login"
+        self.base_api_url = f"{self.base_url}/api"
+        self.logged_in = False
+        self._kids = None
+        self._login_lock = threading.Lock()
+        self.payloads = PayloadLog(logger)
         self.set_headers()
         self.load_cookies()
 
@@ -24,49 +48,36 @@ class HortApi:
             "Accept-Language": "en-US,en;q=0.5",
             "Accept-Encoding": "gzip, deflate, br",
             "Content-Type": "application/json",
-            "Origin": "https://elternportal.hortpro.de",
+            "Origin": self.base_url,
             "Connection": "keep-alive",
-            "Referer": "https://elternportal.hortpro.de/login",
+            "Referer": f"{self.base_url}/login",
             "Sec-Fetch-Dest": "empty",
             "Sec-Fetch-Mode": "cors",
             "Sec-Fetch-Site": "same-origin",
             "TE": "trailers"
         })
-        logging.debug("Set browser-like headers.")
+        logger.debug("Set browser-like headers.")
 
     def load_cookies(self):
-        if os.path.exists(self.cookie_path):
-            try:
-                with open(self.cookie_path, 'r') as f:
-                    cookies = json.load(f)
-                self.session.cookies.update(cookies)
-                logging.info("Loaded cookies from file.")
-                # Check if cookies are still valid
-                if not self.check_cookies_valid():
-                    logging.warning("Cookies are invalid or expired. Performing a new login.")
-                    self.login()
-                else:
-                    logging.info("Cookies are valid.")
-            except Exception as e:
-                logging.error(f"Error loading cookies: {e}")
-                self.login()
-        else:
-            self.login()
+        # Cookies are not validated here, the first request that comes back with 401 triggers a login
+        if not os.path.exists(self.cookie_path):
+            return
+        try:
+            with open(self.cookie_path, 'r') as f:
+                cookies = json.load(f)
+            self.session.cookies.update(cookies)
+            logger.info("Loaded cookies from file.")
+        except Exception as e:
+            logger.error(f"Error loading cookies: {e}")
 
     def save_cookies(self):
-        with open(self.cookie_path, 'w') as f:
-            json.dump(self.session.cookies.get_dict(), f)
-        logging.debug("Saved cookies.")
-
-    def check_cookies_valid(self) -> bool:
-        test_url = f"{self.base_api_url}/kids"
-        response = self.session.get(test_url)
-        if response.status_code == 200:
-            return True
-        else:
-            return False
+        try:
+            atomic_write_json(self.cookie_path, self.session.cookies.get_dict())
+            logger.debug("Saved cookies.")
+        except OSError as e:
+            logger.error(f"Error saving cookies: {e}")
 
-    def login(self):
+    def login(self) -> bool:
         payload = {
             "email": self.email,
             "password": self.password
@@ -74,56 +85,96 @@ class HortApi:
         headers = {
             "Content-Type": "application/json"
         }
-        logging.info("Attempting to log in to HortPro.")
-        response = self.session.post(self.login_url, json=payload, headers=headers)
-        logging.debug(f"Login Response Status Code: {response.status_code}")
-        logging.debug(f"Login Response Text: {response.text}")
+        logger.info("Attempting to log in to HortPro.")
+        self.session.cookies.clear()
+        response = self._send("POST", self.login_url, json=payload, headers=headers)
+        logger.debug(f"Login Response Status Code: {response.status_code}")
+        self.payloads.log("Login", response.text)
+        self.logged_in = False
         if response.status_code == 200:
             cookies = self.session.cookies.get_dict()
             if 'sid-hep' in cookies:
                 self.save_cookies()
-                logging.info("Login successful and cookies saved.")
+                self.logged_in = True
+                logger.info("Login successful and cookies saved.")
             else:
-                logging.error("Login failed: 'sid-hep' cookie not found.")
+                logger.error("Login failed: 'sid-hep' cookie not found.")
         else:
-            logging.error(f"Login failed with status code: {response.status_code}")
-            logging.error(f"Response Text: {response.text}")
+            logger.error(f"Login failed with status code: {response.status_code}")
+            logger.error(f"Response Text: {response.text}")
+        HORTPRO_LOGINS.inc(account=self.name, result="success" if self.logged_in else "failed")
+        return self.logged_in
+
+    def _relogin(self, stale_cookie: Optional[str]) -> bool:
+        """Logs in again, unless the session cookie already changed from the one that failed."""
+        with self._login_lock:
+            # Another thread may already have logged in again while we were waiting
+            cookie = self.session.cookies.get('sid-hep')
+            if cookie is not None and cookie != stale_cookie:
+                return True
+            return self.login()
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        endpoint = urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]
+        started = time.monotonic()
+        try:
+            response = self.transport.request(method, url, **kwargs)
+        except Exception:
+            HORTPRO_RESPONSES.inc(account=self.name, endpoint=endpoint, status="error")
+            raise
+        HORTPRO_REQUEST_SECONDS.observe(time.monotonic() - started, account=self.name, endpoint=endpoint)
+        HORTPRO_RESPONSES.inc(account=self.name, endpoint=endpoint, status=response.status_code)
+        return response
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        # "reused" if the stored cookie was good enough, the rate of those tells how often we log in
+        session = "reused"
+        cookie = self.session.cookies.get('sid-hep')
+        if cookie is None:
+            self._relogin(None)
+            session = "relogin"
+            cookie = self.session.cookies.get('sid-hep')
+        response = self._send(method, url, **kwargs)
+        if response.status_code == 401:
+            logger.warning("Session expired or invalid. Logging in again.")
+            if self._relogin(cookie):
+                session = "relogin"
+                response = self._send(method, url, **kwargs)
+        HORTPRO_SESSIONS.inc(account=self.name, session=session)
+        return response
 
-    def get_kid_id(self) -> Optional[str]:
+    def get_kids(self, refresh: bool = False) -> Optional[List[dict]]:
+        if self._kids is not None and not refresh:
+            return self._kids
         url = f"{self.base_api_url}/kids"
-        logging.info(f"Retrieving kid ID from URL: {url}")
-        response = self.session.get(url)
-        logging.debug(f"Get Kids Response Status Code: {response.status_code}")
-        logging.debug(f"Get Kids Response Text: {response.text}")
+        logger.info(f"Retrieving kids from URL: {url}")
+        response = self.request("GET", url)
+        logger.debug(f"Get Kids Response Status Code: {response.status_code}")
         if response.status_code == 200:
+            self.payloads.log("Get Kids", response.text)
             data = response.json()
-            logging.debug(f"Get Kids Response JSON: {data}")
             if data.get("success") and data.get("data"):
-                if len(data["data"]) > 0:
-                    kid_id = data["data"][0].get("id")
-                    logging.info(f"Found kid ID: {kid_id}")
-                    return kid_id
-                else:
-                    logging.warning("No children found in the data.")
+                self._kids = data["data"]
+                return self._kids
             else:
-                logging.warning("Success not confirmed or no data available.")
+                logger.warning("Success not confirmed or no data available.")
         else:
-            logging.error(f"Error retrieving children with status code: {response.status_code}")
-            logging.error(f"Response Text: {response.text}")
+            logger.error(f"Error retrieving children with status code: {response.status_code}")
+            logger.error(f"Response Text: {response.text}")
         return None
 
     def get_presences(self, kid_id: str, start: int = 0, limit: int = 5) -> Optional[dict]:
         url = f"{self.base_api_url}/kids/{kid_id}/presences?start={start}&limit={limit}"
-        logging.info(f"Retrieving presence data from URL: {url}")
-        response = self.session.get(url)
-        logging.debug(f"Get Presences Response Status Code: {response.status_code}")
-        logging.debug(f"Get Presences Response Text: {response.text}")
+        # Runs on every poll of every kid, so the details are DEBUG only
+        logger.debug(f"Retrieving presence data from URL: {url}")
+        response = self.request("GET", url)
+        logger.debug(f"Get Presences Response Status Code: {response.status_code}")
         if response.status_code == 200:
+            self.payloads.log(f"Get Presences {kid_id} {start}", response.text)
             data = response.json()
-            logging.debug(f"Get Presences Response JSON: {data}")
             if data.get("success"):
                 return data["data"]
         else:
-            logging.error(f"Error retrieving presence data with status code: {response.status_code}")
-            logging.error(f"Response Text: {response.text}")
+            logger.error(f"Error retrieving presence data with status code: {response.status_code}")
+            logger.error(f"Response Text: {response.text}")
         return None
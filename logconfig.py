@@ -0,0 +1,150 @@
+# logconfig.py
+
+import atexit
+import json
+import logging
+import queue
+import re
+import zlib
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+REDACTED = "***"
+# Any key containing one of these is treated as a secret
+SECRET_KEYS = ("password", "passwd", "secret", "token", "cookie", "sid-hep")
+_SECRET_PATTERN = re.compile(r"""(?i)(["']?(?:password|passwd|secret|token|sid-hep)["']?\s*[:=]\s*["']?)([^"',;\s}&]+)""")
+# Attributes every LogRecord has, everything else was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_queue_handler = None
+
+
+def _is_secret(key) -> bool:
+    return isinstance(key, str) and any(secret in key.lower() for secret in SECRET_KEYS)
+
+
+def redact(value):
+    """Copy of a config or payload with every secret value replaced."""
+    if isinstance(value, dict):
+        return {key: REDACTED if _is_secret(key) else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def redact_text(text: str) -> str:
+    return _SECRET_PATTERN.sub(lambda match: match.group(1) + REDACTED, text)
+
+
+class RedactingFilter(logging.Filter):
+    """Masks passwords, tokens and session cookies before a record is written anywhere."""
+
+    def filter(self, record):
+        record.msg = redact_text(record.getMessage())
+        record.args = None
+        for key in record.__dict__.keys() - _RECORD_ATTRIBUTES:
+            if _is_secret(key):
+                setattr(record, key, REDACTED)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, extra={...} fields included."""
+
+    def format(self, record):
+        event = {
+            "ts": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in record.__dict__.keys() - _RECORD_ATTRIBUTES:
+            event[key] = getattr(record, key)
+        if record.exc_info:
+            event["exc"] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str, ensure_ascii=False)
+
+
+class PayloadLog:
+    """Logs API payloads at DEBUG only when they changed, and every n-th unchanged one if sampling is on."""
+
+    # Set from the "logging" config by setup_logging
+    sample_every = 0
+    max_chars = 2000
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self._last = {}
+
+    def log(self, key: str, text: str):
+        # Cheap enough to call on every poll, nothing is hashed or formatted unless DEBUG is on
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        checksum = zlib.crc32(text.encode())
+        last_checksum, unchanged = self._last.get(key, (None, 0))
+        if checksum == last_checksum:
+            unchanged += 1
+            self._last[key] = (checksum, unchanged)
+            if not self.sample_every or unchanged % self.sample_every:
+                return
+            label = f"unchanged x{unchanged}"
+        else:
+            self._last[key] = (checksum, 0)
+            label = "changed"
+        if len(text) > self.max_chars:
+            text = f"{text[:self.max_chars]}... ({len(text)} chars)"
+        self.logger.debug(f"{key} payload ({label}): {text}")
+
+
+def setup_logging(config: dict = None):
+    """(Re)configures the root logger: handlers run on a background thread behind a queue."""
+    global _listener, _queue_handler
+    config = config or {}
+
+    if config.get("format", "text") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    if config.get("file", "app.log"):
+        handlers.append(RotatingFileHandler(
+            config.get("file", "app.log"),
+            maxBytes=config.get("max_bytes", 5 * 1024 * 1024),
+            backupCount=config.get("backup_count", 2),
+        ))
+    if config.get("console", True):
+        handlers.append(logging.StreamHandler())
+    redacting_filter = RedactingFilter()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(redacting_filter)
+
+    root = logging.getLogger()
+    if _listener:
+        stop_logging()
+    log_queue = queue.SimpleQueue()
+    _queue_handler = QueueHandler(log_queue)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root.addHandler(_queue_handler)
+    root.setLevel(config.get("level", "INFO").upper())
+    for name, level in config.get("levels", {}).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    PayloadLog.sample_every = config.get("payload_sample_every", 0)
+    PayloadLog.max_chars = config.get("payload_max_chars", 2000)
+    _listener.start()
+
+
+def stop_logging():
+    # Flushes whatever is still queued
+    global _listener
+    if _listener:
+        _listener.stop()
+        logging.getLogger().removeHandler(_queue_handler)
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
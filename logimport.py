@@ -0,0 +1,271 @@
+# logimport.py
+
+import argparse
+import ast
+import csv
+import gzip
+import json
+import logging
+import re
+import statistics
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Only lines containing one of these are decoded at all, everything else is skipped as raw bytes
+PAYLOAD_MARKER = b"Get Presences"
+URL_MARKER = b"/presences?start="
+
+# Old logs: "Get Presences Response JSON: {python repr}", newer ones: "Get Presences <kid> <start> payload (...): {json}"
+OLD_PAYLOAD = re.compile(r"Get Presences Response JSON: (.*)$")
+NEW_PAYLOAD = re.compile(r"Get Presences (\S+) (\d+) payload \([^)]*\): (.*)$")
+KID_URL = re.compile(r"/kids/([^/]+)/presences\?start=(\d+)")
+TEXT_TIMESTAMP = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}) ")
+
+# One presence row in either Python repr or JSON quoting, much faster than parsing the whole payload
+ROW = re.compile(
+    r"""\{\s*['"]id['"]:\s*['"]([^'"]+)['"],\s*['"]date_start['"]:\s*['"]([^'"]+)['"],\s*"""
+    r"""['"]date_end['"]:\s*(?:['"]([^'"]+)['"]|None|null),\s*['"]duration['"]:\s*(\d+|None|null)\s*\}"""
+)
+
+CSV_COLUMNS = ("id", "kid_id", "date_start", "date_end", "duration", "check_in_seen", "check_out_seen", "last_seen", "observations")
+
+
+def open_log(path: str):
+    # Rotated archives are often compressed
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _parse_rows(payload: str) -> Iterator[Tuple[str, str, Optional[str], Optional[int]]]:
+    matches = ROW.findall(payload)
+    if len(matches) == payload.count("date_start"):
+        for presence_id, date_start, date_end, duration in matches:
+            yield presence_id, date_start, date_end or None, int(duration) if duration.isdigit() else None
+        return
+    # Rows with other fields or a different order, parse the whole payload instead
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        try:
+            data = ast.literal_eval(payload)
+        except (ValueError, SyntaxError):
+            # Truncated payloads still yield the rows that are complete
+            for presence_id, date_start, date_end, duration in matches:
+                yield presence_id, date_start, date_end or None, int(duration) if duration.isdigit() else None
+            return
+    if not isinstance(data, dict):
+        return
+    for row in (data.get("data") or data).get("rows", []):
+        if isinstance(row, dict) and row.get("id") and row.get("date_start"):
+            yield row["id"], row["date_start"], row.get("date_end"), row.get("duration")
+
+
+def iter_payloads(lines: Iterable[bytes]) -> Iterator[Tuple[str, str, int, str]]:
+    """(log time, kid id, start row, payload) for every presences payload in a stream of text or JSON log lines.
+
+    Log times stay strings like "2024-10-22T11:57:18.081", they sort correctly and most are never converted.
+    """
+    kid_id, start = "unknown", 0
+    for raw in lines:
+        if PAYLOAD_MARKER not in raw and URL_MARKER not in raw:
+            continue
+        line = raw.decode("utf-8", "replace").rstrip("\n")
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+                message = record["msg"]
+                logged = record["ts"]
+            except (ValueError, KeyError, TypeError):
+                continue
+        else:
+            match = TEXT_TIMESTAMP.match(line)
+            if not match:
+                continue
+            logged = f"{match.group(1)[:10]}T{match.group(1)[11:]}.{match.group(2)}"
+            message = line[match.end():]
+
+        if PAYLOAD_MARKER not in raw:
+            # Old payload lines don't name the kid or the page, the request logged just before them does
+            url = KID_URL.search(message)
+            if url:
+                kid_id, start = url.group(1), int(url.group(2))
+            continue
+        new = NEW_PAYLOAD.search(message)
+        if new:
+            yield logged, new.group(1), int(new.group(2)), new.group(3)
+            continue
+        old = OLD_PAYLOAD.search(message)
+        if old:
+            yield logged, kid_id, start, old.group(1)
+
+
+class TimelineBuilder:
+    """Presences deduplicated by id, with the log time their check-in and check-out first showed up.
+
+    Only polls of the newest page (start 0) count as sightings, backfill and sync pages return old rows.
+    Memory grows with the number of distinct presences, not with the size of the logs.
+    """
+
+    def __init__(self, tz=None):
+        self.tz = tz
+        self.presences: Dict[str, dict] = {}
+        # Log time of the first newest-page poll per kid, rows already in it were not detected by us
+        self.first_polls: Dict[str, str] = {}
+
+    def add(self, first: str, last: str, count: int, kid_id: str, row: tuple, newest_page: bool = True):
+        presence_id, date_start, date_end, duration = row
+        presence = self.presences.get(presence_id)
+        if presence is None:
+            presence = self.presences[presence_id] = {
+                "id": presence_id, "kid_id": kid_id, "date_start": date_start, "date_end": None, "duration": None,
+                "check_in_seen": None, "check_out_seen": None, "last_seen": last, "observations": 0,
+            }
+        presence["observations"] += count
+        # Archives may come in any order, the first sighting is the earliest one and the values the latest one
+        if newest_page:
+            if presence["check_in_seen"] is None or first < presence["check_in_seen"]:
+                presence["check_in_seen"] = first
+            if date_end and (presence["check_out_seen"] is None or first < presence["check_out_seen"]):
+                presence["check_out_seen"] = first
+        if last >= presence["last_seen"]:
+            presence["last_seen"] = last
+            presence["date_start"], presence["date_end"], presence["duration"] = date_start, date_end, duration
+            if kid_id != "unknown":
+                presence["kid_id"] = kid_id
+
+    def _add_run(self, kid_id: str, start: int, payload: str, first: str, last: str, count: int) -> int:
+        if start == 0 and (kid_id not in self.first_polls or first < self.first_polls[kid_id]):
+            self.first_polls[kid_id] = first
+        rows = 0
+        for row in _parse_rows(payload):
+            self.add(first, last, count, kid_id, row, newest_page=start == 0)
+            rows += count
+        return rows
+
+    def feed(self, path: str) -> int:
+        # Thousands of polls return the same payload, a run of identical ones is parsed only once
+        runs = {}
+        rows = 0
+        with open_log(path) as f:
+            for logged, kid_id, start, payload in iter_payloads(f):
+                run = runs.get((kid_id, start))
+                if run and run[0] == payload:
+                    run[2] = logged
+                    run[3] += 1
+                    continue
+                if run:
+                    rows += self._add_run(kid_id, start, *run)
+                runs[(kid_id, start)] = [payload, logged, logged, 1]
+        for (kid_id, start), run in runs.items():
+            rows += self._add_run(kid_id, start, *run)
+        logger.info(f"{path}: {rows} presence rows, {len(self.presences)} distinct presences so far.")
+        return rows
+
+    def _time(self, logged: Optional[str]) -> Optional[datetime]:
+        if logged is None:
+            return None
+        moment = datetime.fromisoformat(logged)
+        return moment.replace(tzinfo=self.tz) if self.tz else moment.astimezone()
+
+    def timeline(self) -> list:
+        timeline = []
+        for presence in sorted(self.presences.values(), key=lambda presence: presence["date_start"]):
+            timeline.append({**presence, **{key: self._time(presence[key]) for key in ("check_in_seen", "check_out_seen", "last_seen")}})
+        return timeline
+
+    def polls_started(self) -> Dict[str, datetime]:
+        return {kid_id: self._time(logged) for kid_id, logged in self.first_polls.items()}
+
+
+def detection_lags(timeline: list, polls_started: Dict[str, datetime]) -> Dict[str, list]:
+    """Seconds from each check-in and check-out to the first newest-page poll that contained it.
+
+    Rows that were already there in the kid's first poll happened before the logs begin and are left out.
+    """
+    lags = {"check_in": [], "check_out": []}
+    for presence in timeline:
+        started = polls_started.get(presence["kid_id"])
+        if started is None:
+            continue
+        if presence["check_in_seen"] and presence["check_in_seen"] > started:
+            lags["check_in"].append((presence["check_in_seen"] - datetime.fromisoformat(presence["date_start"])).total_seconds())
+        if presence["date_end"] and presence["check_out_seen"] and presence["check_out_seen"] > started:
+            lags["check_out"].append((presence["check_out_seen"] - datetime.fromisoformat(presence["date_end"])).total_seconds())
+    return lags
+
+
+def _serialize(presence: dict) -> dict:
+    return {key: value.isoformat(timespec="seconds") if isinstance(value, datetime) else value for key, value in presence.items()}
+
+
+def write_csv(timeline: list, out):
+    writer = csv.DictWriter(out, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for presence in timeline:
+        writer.writerow(_serialize(presence))
+
+
+def write_jsonl(timeline: list, out):
+    for presence in timeline:
+        out.write(json.dumps(_serialize(presence)) + "\n")
+
+
+def import_history(timeline: list, history_path: str) -> int:
+    from history import PresenceHistory
+
+    history = PresenceHistory(history_path)
+    by_kid = {}
+    for presence in timeline:
+        by_kid.setdefault(presence["kid_id"], []).append(presence)
+    changed = sum(history.store(kid_id, rows) for kid_id, rows in by_kid.items())
+    history.close()
+    return changed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Anwesenheiten aus app.log-Archiven rekonstruieren (auch .gz und JSON-Logs).")
+    parser.add_argument("logs", nargs="+", help="Logdateien, z. B. app.log app.log.1 app.log.2.gz")
+    parser.add_argument("--format", choices=("csv", "jsonl", "store"), default="csv",
+                        help="csv/jsonl nach --output (Standard: stdout), store in die Historie (history_path)")
+    parser.add_argument("--output", default="-")
+    parser.add_argument("--history-path", default="presences.db")
+    parser.add_argument("--timezone", help="Zeitzone der Logzeitstempel (Standard: lokale Zeitzone)")
+    parser.add_argument("--lag", action="store_true", help="Erkennungsverzögerung ausgeben")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+
+    tz = ZoneInfo(args.timezone) if args.timezone else None
+    builder = TimelineBuilder(tz)
+    for path in args.logs:
+        try:
+            builder.feed(path)
+        except OSError as e:
+            logger.error(f"{path} konnte nicht gelesen werden: {e}")
+            return 1
+    timeline = builder.timeline()
+
+    if args.format == "store":
+        changed = import_history(timeline, args.history_path)
+        logger.info(f"{len(timeline)} Anwesenheiten übernommen, {changed} neu oder geändert in '{args.history_path}'.")
+    else:
+        out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+        try:
+            (write_csv if args.format == "csv" else write_jsonl)(timeline, out)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    if args.lag:
+        for kind, lags in detection_lags(timeline, builder.polls_started()).items():
+            if lags:
+                lags.sort()
+                logger.info(f"{kind}: {len(lags)} Ereignisse, Median {statistics.median(lags):.0f} s, "
+                            f"p95 {lags[min(int(len(lags) * 0.95), len(lags) - 1)]:.0f} s, max {lags[-1]:.0f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
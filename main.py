@@ -1,366 +1,274 @@
-import csv
+import asyncio
+import atexit
 import json
-import time
-from hortapi import HortApi
-from models import PresencesPerUser
-import subprocess
-import os
-from datetime import datetime, timedelta, time as dtime
 import logging
-from logging.handlers import RotatingFileHandler
-import threading
+import os
+import sys
+import time
+from datetime import time as datetime_time
+from functools import cached_property
+from logconfig import redact, setup_logging
 
 KEEP_ALIVE_INTERVAL = 600  # 10 minutes in seconds to waiit to receive messages (which is needed by signal protocol)
-# Define application directory and test file path
-app_dir = os.path.dirname(os.path.abspath(__file__))
-test_file_path = os.path.join(app_dir, 'test')
-
-# Configure logging with RotatingFileHandler
-handler = RotatingFileHandler('app.log', maxBytes=5*1024*1024, backupCount=2)
-handler.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-logger.addHandler(handler)
-logger.addHandler(logging.StreamHandler())
-
-# Determine the path to signal-cli
-script_dir = os.path.dirname(os.path.abspath(__file__))
-signal_cli_path = os.path.join(script_dir, 'bin', 'signal-cli')
-
-# Check if signal-cli exists
-if not os.path.isfile(signal_cli_path):
-    logger.error(f"signal-cli not found at: {signal_cli_path}")
-    exit()
-
-# Check permissions
-if not os.access(signal_cli_path, os.X_OK):
-    logger.error(f"signal-cli is not executable. Ensure permissions are set correctly: {signal_cli_path}")
-    exit()
-
-# Load configuration
-try:
-    with open('config.json', 'r') as f:
-        config = json.load(f)
-    logger.info("Configuration file 'config.json' loaded successfully.")
-    logger.debug(f"Configuration content: {config}")
-except FileNotFoundError:
-    logger.error("Configuration file 'config.json' not found. Ensure it is in the same directory as 'main.py'.")
-    exit()
-except json.JSONDecodeError as e:
-    logger.error(f"Error parsing 'config.json': {e}")
-    exit()
-except Exception as e:
-    logger.error(f"Unexpected error loading 'config.json': {e}")
-    exit()
-
-SIGNAL_NUMBER = config.get("signal_number")
-HORTPRO_EMAIL = config.get("hortpro_login", {}).get("email")
-HORTPRO_PASSWORD = config.get("hortpro_login", {}).get("password")
-CHECK_INTERVAL = config.get("check_interval_seconds", 60)
-COOKIE_PATH = config.get("cookie_path", "cookie.txt")
-SIGNAL_CLI_RELATIVE_PATH = config.get("signal_cli_path", "bin/signal-cli")
-signal_cli_path = os.path.join(script_dir, SIGNAL_CLI_RELATIVE_PATH)
-
-# Check if all necessary configuration data is present
-if not SIGNAL_NUMBER or not HORTPRO_EMAIL or not HORTPRO_PASSWORD:
-    logger.error("Missing configuration data. Check 'config.json' for 'signal_number', 'hortpro_login.email', and 'hortpro_login.password'.")
-    exit()
-
-# Load recipients (individuals and groups)
-try:
-    if os.path.exists("chat_ids.json"):
-        with open("chat_ids.json", "r") as f:
-            chat_ids = json.load(f)
-        logger.info(f"{len(chat_ids)} recipients loaded from 'chat_ids.json'.")
-        logger.debug(f"Recipient list: {chat_ids}")
-    else:
-        chat_ids = []
-        logger.info("No recipients found. Please add recipients using 'add_recipient.py'.")
-except json.JSONDecodeError as e:
-    logger.error(f"Error parsing 'chat_ids.json': {e}")
-    chat_ids = []
-except Exception as e:
-    logger.error(f"Unexpected error loading 'chat_ids.json': {e}")
-    chat_ids = []
-
-def send_signal_message(recipient: str, recipient_type: str, message: str):
-    if recipient_type == "individual":
-        cmd = [
-            signal_cli_path, "-u", SIGNAL_NUMBER, "send", "-m", message, recipient
-        ]
-    elif recipient_type == "group":
-        cmd = [
-            signal_cli_path, "-u", SIGNAL_NUMBER, "send", "-g", recipient, "-m", message
-        ]
-    else:
-        logger.warning(f"Unknown recipient type: {recipient_type}")
-        return
-
-    logger.debug(f"Sending message to {recipient_type} {recipient}: {message}")
-    
-    try:
-        # Suppress Signal-CLI debug messages by redirecting stderr to /dev/null
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
-        logger.info(f"Message sent to {recipient}: {message}")
-        logger.debug(f"Command Output (stdout): {result.stdout.strip()}")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error Output: {e.stdout.strip()}")
-        logger.error(f"Return Code: {e.returncode}")
-        logger.error(f"Error sending message to {recipient}: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error sending message to {recipient}: {e}")
+STATUS_COMMAND = "status"
+# Application directory, signal-cli and the test mode file are looked up relative to it
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def load_schedule(schedule_file='scheduler.csv'):
-    schedule = {}
-    try:
-        with open(schedule_file, mode='r') as csvfile:
-            reader = csv.DictReader(filter(lambda row: not row.strip().startswith('#'), csvfile))
-            for row in reader:
-                day = row['day_of_week'].strip().lower()
-                start_time = datetime.strptime(row['start_time'], '%H:%M').time()
-                end_time = datetime.strptime(row['end_time'], '%H:%M').time()
-                schedule.setdefault(day, []).append((start_time, end_time))
-        logger.info(f"Schedule loaded from {schedule_file}.")
-    except Exception as e:
-        logger.error(f"Error loading schedule from {schedule_file}: {e}")
-    return schedule
-
-class PresencesPerUser:
-    def __init__(self, recipient_id, recipient_type):
-        self.recipient_id = recipient_id
-        self.recipient_type = recipient_type
-        self.date_start = None
-        self.date_end = None
-        self.start_msg_sent = False
-        self.end_msg_sent = False
-
-def monitor_presences(hort_api, kid_id, presences_per_users):
-    presences = hort_api.get_presences(kid_id)
-    if not presences:
-        logger.warning("No presence data retrieved.")
-        return
-
-    today = datetime.now().date()
-    try:
-        today_presence = next(
-            (
-                item
-                for item in presences.get("rows", [])
-                if datetime.fromisoformat(item["date_start"]).date() == today
-            ),
-            None,
-        )
-    except KeyError as e:
-        logger.error(f"Missing key in presence data: {e}")
-        return
-    except ValueError as e:
-        logger.error(f"Error parsing date: {e}")
-        return
-
-    if not today_presence:
-        logger.info("No presence data found for today.")
-        return
-
-    start_date = today_presence.get("date_start")
-    end_date = today_presence.get("date_end")
-
-    logger.debug(f"Today's presence data: Start: {start_date}, End: {end_date}")
-
-    for chat in chat_ids:
-        recipient = chat["id"]
-        recipient_type = chat["type"]
-
-        # Initialize presence for the recipient if not present
-        if recipient not in presences_per_users:
-            presences_per_users[recipient] = PresencesPerUser(recipient_id=recipient, recipient_type=recipient_type)
-
-        presence = presences_per_users[recipient]
-
-        # Reset the start_msg_sent and end_msg_sent if it's a new day
-        if presence.date_start is None or datetime.fromisoformat(presence.date_start).date() != today:
-            presence.start_msg_sent = False
-            presence.end_msg_sent = False
-            presence.date_start = start_date
-            presence.date_end = end_date
-
-        # Check-In
-        if start_date and not presence.start_msg_sent:
-            try:
-                formatted_start = datetime.fromisoformat(start_date).strftime('%H:%M')
-                message = f"Your child has been at the daycare since {formatted_start}."
-                send_signal_message(recipient, recipient_type, message)
-                presence.start_msg_sent = True
-                logger.info(f"Check-In message sent to {recipient}.")
-            except Exception as e:
-                logger.error(f"Error sending Check-In message to {recipient}: {e}")
-
-        # Check-Out
-        if end_date and not presence.end_msg_sent:
-            try:
-                formatted_end = datetime.fromisoformat(end_date).strftime('%H:%M')
-                message = f"Your child left the daycare at {formatted_end}."
-                send_signal_message(recipient, recipient_type, message)
-                presence.end_msg_sent = True
-                logger.info(f"Check-Out message sent to {recipient}.")
-            except Exception as e:
-                logger.error(f"Error sending Check-Out message to {recipient}: {e}")
-
-        # Update the presence status
-        presences_per_users[recipient] = presence
+logger = logging.getLogger(__name__)
 
-    try:
-        with open("presences_per_users.json", "w") as f:
-            json.dump(
-                {k: v.__dict__ for k, v in presences_per_users.items()},
-                f,
-                indent=4,
-            )
-        logger.debug("Presence data updated and saved.")
-    except Exception as e:
-        logger.error(f"Error saving presence data: {e}")
-
-
-def get_next_window_start(now, schedule):
-    weekday_str = now.strftime('%A').lower()
-    today_schedule = schedule.get(weekday_str, [])
-
-    for window in today_schedule:
-        start, _ = window
-        window_start_dt = datetime.combine(now.date(), start)
-        if now < window_start_dt:
-            return window_start_dt
-
-    # Find next day with schedule
-    days_ahead = 1
-    while days_ahead <= 7:
-        next_day = now + timedelta(days=days_ahead)
-        weekday_str = next_day.strftime('%A').lower()
-        next_day_schedule = schedule.get(weekday_str, [])
-        if next_day_schedule:
-            return datetime.combine(next_day.date(), next_day_schedule[0][0])
-        days_ahead += 1
-    return None
-
-def run_test_mode():
-    logger.info("Test mode file found. Running test mode.")
-    logger.info("Simulating child check-in...")
-    for chat in chat_ids:
-        send_signal_message(chat["id"], chat["type"], "Test Mode: Your child has checked in.")
-    # Reduced sleep time for quicker testing
-    time.sleep(10)
-
-    logger.info("Simulating child check-out...")
-    for chat in chat_ids:
-        send_signal_message(chat["id"], chat["type"], "Test Mode: Your child has checked out.")
-
-    # Delete the test file after completing test runs
-    os.remove(test_file_path)
-    logger.info("Test mode completed. Test file deleted.")
-
-    # Restart the service to resume normal operation
-    # logger.info("Restarting service to resume normal operation.")
-    # os.system("systemctl restart hortpro_notifier.service")
-    
-def send_keep_alive_message():
-    logger.info("Sending keep-alive message to maintain Signal connection...")
-    try:
-        # Send a "ping" message to yourself or simply sync contacts to keep the connection active
-        # Using sync to avoid redundant messages, but you can send a message if preferred.
-        result = subprocess.run(
-            [signal_cli_path, "-u", SIGNAL_NUMBER, "receive"], capture_output=True, text=True, check=True
-        )
-        logger.debug("Keep-alive sync completed successfully.")
-        logger.debug(f"Keep-alive Command Output (stdout): {result.stdout}")
-        logger.debug(f"Keep-alive Command Errors (stderr): {result.stderr}")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error during keep-alive operation: {e.stderr}")
-    except Exception as e:
-        logger.error(f"Unexpected error during keep-alive operation: {e}")
 
-    # Schedule the next keep-alive call
-    threading.Timer(KEEP_ALIVE_INTERVAL, send_keep_alive_message).start()
+class StartupError(Exception):
+    """The notifier can't be set up, run() logs it and exits with 1."""
 
-def main_loop():
-    schedule = load_schedule()
 
-    presences_per_users = {}
-    
-    # Call this function during startup to initiate the keep-alive loop
-    send_keep_alive_message()
+def load_config(path: str = "config.json") -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise StartupError(f"Configuration file '{path}' not found. Ensure it is in the same directory as 'main.py'.")
+    except json.JSONDecodeError as e:
+        raise StartupError(f"Error parsing '{path}': {e}")
+    except Exception as e:
+        raise StartupError(f"Unexpected error loading '{path}': {e}")
+
+
+class Notifier:
+    """The notifier's components, each created the first time something needs it.
+
+    Importing this module has no side effects, so tools can reuse the config handling and components.
+    """
+
+    def __init__(self, config_path: str = "config.json", app_dir: str = APP_DIR):
+        self.config_path = config_path
+        self.app_dir = app_dir
+        self.test_file_path = os.path.join(app_dir, "test")
+
+    @cached_property
+    def config(self) -> dict:
+        config = load_config(self.config_path)
+        setup_logging(config.get("logging"))
+        logger.info(f"Configuration file '{self.config_path}' loaded successfully.")
+        logger.debug(f"Configuration content: {redact(config)}")
+        return config
+
+    def section(self, name: str) -> dict:
+        return self.config.get(name, {})
+
+    @cached_property
+    def accounts(self) -> list:
+        from engine import load_accounts
+
+        accounts = load_accounts(self.config, cookie_path=self.config.get("cookie_path", "cookie.txt"))
+        # Check if all necessary configuration data is present
+        if not self.config.get("signal_number") or not accounts or not all(account.email and account.password for account in accounts):
+            raise StartupError("Missing configuration data. Check 'config.json' for 'signal_number', 'hortpro_login.email', and 'hortpro_login.password'.")
+        return accounts
+
+    @cached_property
+    def signal_cli_path(self) -> str:
+        path = os.path.join(self.app_dir, self.config.get("signal_cli_path", "bin/signal-cli"))
+        if not os.path.isfile(path):
+            raise StartupError(f"signal-cli not found at: {path}")
+        if not os.access(path, os.X_OK):
+            raise StartupError(f"signal-cli is not executable. Ensure permissions are set correctly: {path}")
+        return path
+
+    @cached_property
+    def signal_sender(self):
+        from signal_cli import SignalSender
+
+        # One long-lived signal-cli process for all sends instead of one JVM per message
+        sender = SignalSender(self.signal_cli_path, self.config.get("signal_number"),
+                              backend=self.config.get("signal_backend", "daemon"),
+                              send_timeout=self.section("notifications").get("send_timeout_seconds", 60))
+        atexit.register(sender.stop)
+        return sender
+
+    def send_signal_message(self, recipients, recipient_type: str, message: str):
+        return self.signal_sender.send(recipients, recipient_type, message)
+
+    @cached_property
+    def dispatcher(self):
+        from dispatcher import NotificationDispatcher
+
+        notifications = self.section("notifications")
+        # Polling only queues notifications, the dispatcher workers deliver them and retry failed sends
+        dispatcher = NotificationDispatcher(
+            self.send_signal_message,
+            path=notifications.get("outbox_path", "outbox.db"),
+            workers=notifications.get("workers", 2),
+            max_queue=notifications.get("max_queue", 1000),
+            max_attempts=notifications.get("max_attempts", 6),
+        )
+        atexit.register(dispatcher.stop)
+        return dispatcher
+
+    @cached_property
+    def engine(self):
+        from engine import PollingEngine
+
+        engine_config = self.section("engine")
+        polling = self.section("polling")
+        notifications = self.section("notifications")
+        # Every account runs as its own task, sharing one connection pool and a global request rate limit
+        return PollingEngine(
+            self.accounts,
+            self.dispatcher.enqueue,
+            poll_interval=self.config.get("check_interval_seconds", 60),
+            polling={
+                "min_interval": polling.get("min_interval_seconds"),
+                "max_interval": polling.get("max_interval_seconds", 900),
+                "margin_minutes": polling.get("margin_minutes", 20),
+            },
+            max_concurrent_requests=engine_config.get("max_concurrent_requests", 8),
+            requests_per_second=engine_config.get("requests_per_second", 5),
+            requests_per_account=engine_config.get("requests_per_account", 2),
+            request_timeout=engine_config.get("request_timeout_seconds", 60),
+            history_path=self.config.get("history_path", "presences.db"),
+            timezone=self.config.get("timezone"),
+            base_url=self.config.get("hortpro_url", "https://elternportal.hortpro.de"),
+            transport={
+                "connect_timeout": engine_config.get("connect_timeout_seconds", 5),
+                "read_timeout": engine_config.get("read_timeout_seconds", 20),
+                "max_retries": engine_config.get("max_retries", 2),
+                "breaker_failures": engine_config.get("breaker_failures", 5),
+                "breaker_reset": engine_config.get("breaker_reset_seconds", 60),
+            },
+            notifications={
+                "recipient_rate": notifications.get("recipient_messages_per_hour", 20) / 3600,
+                "recipient_burst": notifications.get("recipient_burst", 3),
+                "account_rate": notifications.get("account_messages_per_minute", 6) / 60,
+                "account_burst": notifications.get("account_burst", 10),
+            },
+        )
 
-    while True:
-        try:
+    @cached_property
+    def receiver(self):
+        from signal_cli import SignalReceiver
+
+        # Keeps receiving messages, which the Signal protocol needs, and answers "status" requests
+        receiver = SignalReceiver(self.signal_sender, interval=KEEP_ALIVE_INTERVAL, on_message=self.handle_incoming_message)
+        atexit.register(receiver.stop)
+        return receiver
+
+    def handle_incoming_message(self, source, group_id, text):
+        if text.strip().lower() != STATUS_COMMAND:
+            return
+        recipient, recipient_type = (group_id, "group") if group_id else (source, "individual")
+        # Only recipients of an account get an answer, and only about their own kids
+        lines = self.engine.status_for(recipient)
+        if lines:
+            self.dispatcher.enqueue([recipient], recipient_type, "\n".join(lines))
+
+    def run_test_mode(self):
+        from recipients import load_recipients
+
+        logger.info("Test mode file found. Running test mode.")
+        chat_ids = [chat for account in self.accounts for chat in load_recipients(account.chat_ids_path)]
+        individuals = [chat["id"] for chat in chat_ids if chat["type"] == "individual"]
+        groups = [chat["id"] for chat in chat_ids if chat["type"] == "group"]
+        logger.info("Simulating child check-in...")
+        for recipients, recipient_type in ((individuals, "individual"), (groups, "group")):
+            if recipients:
+                self.send_signal_message(recipients, recipient_type, "Test Mode: Your child has checked in.")
+        # Reduced sleep time for quicker testing
+        time.sleep(10)
+
+        logger.info("Simulating child check-out...")
+        for recipients, recipient_type in ((individuals, "individual"), (groups, "group")):
+            if recipients:
+                self.send_signal_message(recipients, recipient_type, "Test Mode: Your child has checked out.")
+
+        # Delete the test file after completing test runs
+        os.remove(self.test_file_path)
+        logger.info("Test mode completed. Test file deleted.")
+
+        # Restart the service to resume normal operation
+        # logger.info("Restarting service to resume normal operation.")
+        # os.system("systemctl restart hortpro_notifier.service")
+
+    async def watch_test_mode(self):
+        while True:
             # Check if test mode file exists
-            if os.path.isfile(test_file_path):
-                run_test_mode()
-                
-            now = datetime.now()
-            weekday_str = now.strftime('%A').lower()
-            current_time = now.time()
-
-            today_schedule = schedule.get(weekday_str, [])
-
-            within_window = False
-            current_window_end = None
-            for window in today_schedule:
-                start, end = window
-                if start <= current_time <= end:
-                    within_window = True
-                    current_window_end = datetime.combine(now.date(), end)
-                    break
-
-            if within_window:
-                hort_api = HortApi(email=HORTPRO_EMAIL, password=HORTPRO_PASSWORD, cookie_path=COOKIE_PATH)
-                kid_id = hort_api.get_kid_id()
-                
-                if not kid_id:
-                    logger.error("Failed to retrieve kid ID. Attempting to re-login and refresh cookie.")
-                    if os.path.exists(COOKIE_PATH):
-                        os.remove(COOKIE_PATH)
-                    hort_api = HortApi(email=HORTPRO_EMAIL, password=HORTPRO_PASSWORD, cookie_path=COOKIE_PATH)
-                    kid_id = hort_api.get_kid_id()
-
-                while within_window:
-                    now = datetime.now()
-                    current_time = now.time()
-
-                    # Recalculate if we are still within the window
-                    for window in today_schedule:
-                        start, end = window
-                        if start <= current_time <= end:
-                            within_window = True
-                            current_window_end = datetime.combine(now.date(), end)
-                            break
-                    else:
-                        within_window = False
-
-                    if kid_id:
-                        monitor_presences(hort_api, kid_id, presences_per_users)
-                    else:
-                        logger.error("No child found. Skipping this window.")
-
-                    if within_window:
-                        logger.info("Sleeping for 60 seconds before the next scrape.")
-                        time.sleep(60)
-            else:
-                next_window_start = get_next_window_start(now, schedule)
-                if next_window_start:
-                    sleep_seconds = (next_window_start - now).total_seconds()
-                    logger.info(f"Outside time windows. Sleeping until next window at {next_window_start.strftime('%Y-%m-%d %H:%M')}. ({int(sleep_seconds)} seconds)")
-                    if sleep_seconds > 0:
-                        time.sleep(sleep_seconds)
-                else:
-                    logger.info("No scheduled windows found. Sleeping for 1 hour.")
-                    time.sleep(3600)
-
-        except Exception as e:
-            logger.error(f"Error in main loop: {e}")
-            time.sleep(60)
+            if os.path.isfile(self.test_file_path):
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.run_test_mode)
+                except Exception as e:
+                    logger.error(f"Error in test mode: {e}")
+            await asyncio.sleep(60)
+
+    def start_metrics_server(self):
+        metrics_config = self.section("metrics")
+        # Off unless a port is configured, it should never be reachable from outside by accident
+        if not metrics_config.get("port"):
+            return None
+        from metrics import REGISTRY, MetricsServer
+
+        engine, receiver, dispatcher = self.engine, self.receiver, self.dispatcher
+        REGISTRY.gauge("signal_receiver_up", "1 if the Signal receive thread is running.",
+                       lambda: int(receiver.health()["running"]))
+        REGISTRY.gauge("signal_receiver_last_success_age_seconds", "Seconds since the last successful receive or daemon check.",
+                       lambda: time.time() - receiver.last_success if receiver.last_success else None)
+        REGISTRY.gauge("signal_receiver_messages", "Incoming Signal messages since the start.", lambda: receiver.messages_received)
+        REGISTRY.gauge("outbox_pending", "Notifications waiting in the outbox.", dispatcher.pending_count)
+
+        def status():
+            return {
+                "accounts": [{"name": account.name, "kids": [kid.name or kid.id for kid in account.monitor.kids]} for account in engine.accounts],
+                "receiver": receiver.health(),
+                "outbox": {"pending": dispatcher.pending_count(), "dead": len(dispatcher.dead_letters())},
+            }
 
-if __name__ == "__main__":
+        try:
+            server = MetricsServer(metrics_config.get("host", "127.0.0.1"), metrics_config["port"], status=status)
+        except OSError as e:
+            logger.error(f"Could not start the metrics endpoint: {e}")
+            return None
+        server.start()
+        atexit.register(server.stop)
+        return server
+
+    def start_digests(self):
+        reports_config = self.section("reports")
+        # Weekly and monthly attendance summaries, both off unless enabled in config.json
+        kinds = [kind for kind in ("week", "month") if reports_config.get(f"{kind}ly_digest")]
+        if not kinds:
+            return None
+        from reports import PresenceReports, ReportCache, run_digests
+
+        hour, minute = (int(part) for part in reports_config.get("digest_time", "18:00").split(":"))
+        reports = PresenceReports(self.engine.history, ReportCache(self.config.get("history_path", "presences.db")))
+        return run_digests(self.engine, reports, kinds, weekday=reports_config.get("digest_weekday", 4),
+                           at=datetime_time(hour, minute))
+
+    async def run_all(self):
+        digests = self.start_digests()
+        await asyncio.gather(self.engine.run(), self.watch_test_mode(), *([digests] if digests else []))
+
+    def start(self):
+        # Config and signal-cli are checked before anything is started
+        logger.info(f"{len(self.accounts)} account(s) configured, using signal-cli at {self.signal_cli_path}.")
+        self.signal_sender.start()
+        self.dispatcher.start()
+        # Created before the receiver, whose thread answers status requests from it
+        logger.info(f"Polling engine ready for {len(self.engine.accounts)} account(s).")
+        self.receiver.start()
+        self.start_metrics_server()
+        asyncio.run(self.run_all())
+
+
+def run(config_path: str = "config.json") -> int:
+    # Default logging until config.json is loaded, it may change levels, format and file
+    setup_logging()
     logger.info("HortPro Signal Notifier started.")
-    main_loop()
+    try:
+        Notifier(config_path).start()
+    except StartupError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
 
+if __name__ == "__main__":
+    sys.exit(run())
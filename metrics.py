@@ -0,0 +1,248 @@
+# metrics.py
+
+import json
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a fast HortPro response up to a signal-cli JVM start or a missed poll
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict, extra: dict = None) -> str:
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in values]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {",".join(key) or "": value for key, value in self._values.items()}
+
+
+class Gauge(Metric):
+    """Read when scraped, from a function returning a number or a {label tuple: number} dict."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.read = read
+
+    def _read(self) -> dict:
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.error(f"Error reading metric {self.name}: {e}")
+            return {}
+        if value is None:
+            return {}
+        return value if isinstance(value, dict) else {(): value}
+
+    def render(self) -> list:
+        return self.header() + [
+            f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in self._read().items()
+        ]
+
+    def snapshot(self) -> dict:
+        return {",".join(key) or "": value for key, value in self._read().items()}
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            # Bucket counts are stored per bucket and only made cumulative when rendered
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list:
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        lines = self.header()
+        for key, counts, total, count in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                ",".join(key) or "": {"count": count, "sum": total, "mean": total / count if count else None}
+                for key, (_, total, count) in self._values.items()
+            }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Registering twice returns the first one, so modules can declare their metrics on import
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable, labelnames: Sequence[str] = ()) -> Gauge:
+        with self._lock:
+            # Gauges read live objects, a newer registration replaces the old reader
+            self._metrics[name] = Gauge(name, help, read, labelnames)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+HORTPRO_REQUEST_SECONDS = REGISTRY.histogram(
+    "hortpro_request_seconds", "HortPro API request latency.", ("account", "endpoint"))
+HORTPRO_RESPONSES = REGISTRY.counter(
+    "hortpro_responses_total", "HortPro API responses by status code.", ("account", "endpoint", "status"))
+HORTPRO_LOGINS = REGISTRY.counter(
+    "hortpro_logins_total", "HortPro logins.", ("account", "result"))
+HORTPRO_SESSIONS = REGISTRY.counter(
+    "hortpro_session_requests_total", "HortPro requests served by a stored cookie (reused) or after a login (relogin).",
+    ("account", "session"))
+POLLS = REGISTRY.counter("polls_total", "Presence polls.", ("account",))
+POLL_SECONDS = REGISTRY.histogram("poll_seconds", "Duration of a poll including processing.", ("account",))
+POLLS_PER_WINDOW = REGISTRY.histogram(
+    "polls_per_window", "Polls of an account in one schedule window.", ("account",),
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+DETECTION_LAG_SECONDS = REGISTRY.histogram(
+    "detection_lag_seconds", "Time from a check-in or check-out to its detection.", ("account", "kind"))
+SIGNAL_SEND_SECONDS = REGISTRY.histogram(
+    "signal_send_seconds", "signal-cli send latency per recipient.", ("recipient", "backend"))
+SIGNAL_SENDS = REGISTRY.counter("signal_sends_total", "signal-cli sends per recipient.", ("recipient", "result"))
+
+
+class MetricsServer:
+    """Serves /metrics in the Prometheus text format and /status as JSON."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9464, registry: MetricsRegistry = REGISTRY,
+                 status: Optional[Callable[[], dict]] = None):
+        self.registry = registry
+        self.status = status
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        host, port = self.server.server_address[:2]
+        logger.info(f"Metrics available on http://{host}:{port}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _status(self) -> dict:
+        status = {"metrics": self.registry.snapshot()}
+        if self.status:
+            try:
+                status.update(self.status())
+            except Exception as e:
+                status["error"] = str(e)
+        return status
+
+    def _handler_class(self):
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body = metrics_server.registry.render().encode()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/status":
+                    body = json.dumps(metrics_server._status(), default=str, indent=2).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -1,17 +1,65 @@
 # models.py
 
-from dataclasses import dataclass, field
+import sys
+from dataclasses import dataclass
+from datetime import date, datetime
 from typing import Optional
 
-@dataclass
-class Presence:
-    date_start: Optional[str] = None
+# Created for every kid and event on every poll, slots keep them small (Python 3.10+)
+SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**SLOTS)
+class Kid:
+    id: str
+    name: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, data: dict) -> "Kid":
+        first_name = data.get("firstname") or data.get("first_name")
+        name = first_name or data.get("name")
+        return cls(id=data["id"], name=name)
+
+    def matches(self, selector: str) -> bool:
+        # Recipients may refer to a kid by its HortPro ID or by its first name
+        return selector == self.id or (self.name is not None and selector.lower() == self.name.lower())
+
+@dataclass(**SLOTS)
+class AccountConfig:
+    name: str
+    email: str
+    password: str
+    cookie_path: str = "cookie.txt"
+    chat_ids_path: str = "chat_ids.json"
+    schedule_file: str = "scheduler.csv"
+    closures_file: Optional[str] = None
+    state_path: str = "notifications_sent.json"
+
+@dataclass(**SLOTS)
+class PresenceEvent:
+    kind = "event"
+    kid_id: str
+    presence_id: str
+    date_start: str
     date_end: Optional[str] = None
-    start_msg_sent: bool = False
-    end_msg_sent: bool = False
-
-@dataclass
-class PresencesPerUser:
-    recipient_id: str  # Telefonnummer oder Gruppen-ID
-    recipient_type: str  # "individual" oder "group"
-    presence: Presence = field(default_factory=Presence)
+
+    @property
+    def day(self) -> date:
+        return datetime.fromisoformat(self.date_start).date()
+
+@dataclass(**SLOTS)
+class CheckIn(PresenceEvent):
+    kind = "check_in"
+
+@dataclass(**SLOTS)
+class CheckOut(PresenceEvent):
+    kind = "check_out"
+
+@dataclass(**SLOTS)
+class Corrected(PresenceEvent):
+    kind = "corrected"
+    field: str = "date_start"
+    old_value: Optional[str] = None
+
+@dataclass(**SLOTS)
+class Removed(PresenceEvent):
+    kind = "removed"
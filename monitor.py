@@ -0,0 +1,172 @@
+# monitor.py
+
+import logging
+from datetime import datetime
+from clock import SYSTEM_CLOCK
+from diff import PresenceDiff
+from metrics import DETECTION_LAG_SECONDS
+from models import CheckIn, CheckOut, Corrected, Kid, Removed
+from policy import NotificationPolicy
+from state import NotificationState
+
+logger = logging.getLogger(__name__)
+
+
+class AccountMonitor:
+    """Notification logic for the kids and recipients of one HortPro account."""
+
+    def __init__(self, name, hort_api, history, recipients, send_message, state_path="notifications_sent.json",
+                 clock=SYSTEM_CLOCK, policy=None, flush=None):
+        self.name = name
+        self.clock = clock
+        self.hort_api = hort_api
+        self.history = history
+        self.diff = PresenceDiff(history)
+        self.recipients = recipients
+        self.send_message = send_message
+        # Shared by all accounts in the engine, so per-recipient limits hold across accounts
+        self.policy = policy or NotificationPolicy(send_message, clock=clock)
+        # A shared policy also sends other accounts' messages, the engine's flush saves their states too
+        self.flush = flush or self.policy.flush
+        self.state = NotificationState(state_path)
+        self.kids = []
+
+    def load_kids(self, refresh=False):
+        kids = self.hort_api.get_kids(refresh=refresh)
+        if kids is None and self.kids:
+            # A failed refresh is no reason to stop monitoring the kids we know
+            logger.warning(f"[{self.name}] Could not refresh the kids, keeping the {len(self.kids)} known one(s).")
+            return self.kids
+        self.kids = [Kid.from_api(kid) for kid in kids or []]
+        if self.kids:
+            logger.info(f"[{self.name}] Monitoring {len(self.kids)} kid(s): {', '.join(kid.name or kid.id for kid in self.kids)}")
+        return self.kids
+
+    def recipients_for_kid(self, kid):
+        return self.recipients.for_kid(kid)
+
+    def status_lines(self, recipient):
+        today = self.clock.now().date()
+        lines = []
+        for kid in self.kids:
+            if not any(chat["id"] == recipient for chat in self.recipients_for_kid(kid)):
+                continue
+            child = kid.name or "Your child"
+            rows = self.history.rows_on(kid.id, today)
+            if not rows:
+                lines.append(f"{child} has not been at the daycare today.")
+            elif rows[0].get("date_end"):
+                lines.append(f"{child} left the daycare at {_format_time(rows[0]['date_end'])}.")
+            else:
+                lines.append(f"{child} has been at the daycare since {_format_time(rows[0]['date_start'])}.")
+        return lines
+
+    def process_presences(self, all_presences):
+        # Returns the number of new or changed rows per kid, so the caller can fetch pages it missed
+        changed_rows = {}
+        today = self.clock.now().date()
+        for kid in self.kids:
+            presences = all_presences.get(kid.id)
+            if not presences:
+                logger.warning(f"[{self.name}] No presence data retrieved for kid {kid.id}.")
+                continue
+            rows = presences.get("rows", [])
+            try:
+                events = self.diff.diff(kid.id, rows, today)
+                changed_rows[kid.id] = self.history.store(kid.id, rows)
+                self.history.remove([event.presence_id for event in events if isinstance(event, Removed)])
+            except (KeyError, ValueError) as e:
+                logger.error(f"[{self.name}] Error parsing presence data: {e}")
+                continue
+            # Recipients are only looked at when something actually happened
+            if events:
+                self.notify(kid, events, today, multiple_kids=len(self.kids) > 1)
+
+        # Everything found in this poll goes out together, as far as the rate limits allow
+        self.flush()
+        # Only touches the disk if a notification went out or an old day was dropped
+        self.state.prune(today)
+        self.state.save()
+        return changed_rows
+
+    def format_message(self, event, child):
+        if isinstance(event, CheckIn):
+            return f"{child} has been at the daycare since {_format_time(event.date_start)}."
+        if isinstance(event, CheckOut):
+            return f"{child} left the daycare at {_format_time(event.date_end)}."
+        if isinstance(event, Corrected):
+            if event.old_value and getattr(event, event.field) and _format_time(event.old_value) == _format_time(getattr(event, event.field)):
+                # Seconds moved, the message would read the same
+                return None
+            if event.field == "date_start":
+                return f"Correction: {child} has been at the daycare since {_format_time(event.date_start)} (not {_format_time(event.old_value)})."
+            if event.date_end:
+                return f"Correction: {child} left the daycare at {_format_time(event.date_end)} (not {_format_time(event.old_value)})."
+            return f"Correction: {child} has not left the daycare yet."
+        if isinstance(event, Removed):
+            return f"Correction: the presence of {child} since {_format_time(event.date_start)} was removed by the daycare."
+        return None
+
+    def coalesce(self, events, child):
+        """(keys, message, event) per notification, a check-in and check-out found together become one message."""
+        check_outs = {event.presence_id: event for event in events if isinstance(event, CheckOut)}
+        together = {event.presence_id for event in events if isinstance(event, CheckIn)} & check_outs.keys()
+        notifications = []
+        for event in events:
+            if event.presence_id in together and isinstance(event, CheckOut):
+                continue
+            if event.presence_id in together and isinstance(event, CheckIn):
+                check_out = check_outs[event.presence_id]
+                notifications.append((
+                    [f"{event.presence_id}:{event.kind}", f"{check_out.presence_id}:{check_out.kind}"],
+                    f"{child} arrived at the daycare at {_format_time(event.date_start)} and left at {_format_time(check_out.date_end)}.",
+                    event,
+                ))
+                continue
+            message = self.format_message(event, child)
+            if message is None:
+                continue
+            if isinstance(event, Corrected):
+                key = f"{event.presence_id}:corrected:{event.field}:{getattr(event, event.field)}"
+            else:
+                key = f"{event.presence_id}:{event.kind}"
+            notifications.append(([key], message, event))
+        return notifications
+
+    def notify(self, kid, events, today, multiple_kids=False):
+        # Changes to earlier days are kept in the history, but nobody needs a message about them
+        for event in events:
+            if event.day != today:
+                logger.debug(f"[{self.name}] Ignoring {event.kind} of kid {kid.id} from {event.day}.")
+        events = [event for event in events if event.day == today]
+
+        for event in events:
+            # After a restart the diff reports today's events again, they were detected long ago
+            if isinstance(event, (CheckIn, CheckOut)) and not self.state.was_sent_to_anyone(today, f"{event.presence_id}:{event.kind}"):
+                happened = event.date_start if isinstance(event, CheckIn) else event.date_end
+                DETECTION_LAG_SECONDS.observe(self.clock.time() - datetime.fromisoformat(happened).timestamp(),
+                                              account=self.name, kind=event.kind)
+
+        child = kid.name if multiple_kids and kid.name else "Your child"
+        for keys, message, event in self.coalesce(events, child):
+            for chat in self.recipients_for_kid(kid):
+                recipient = chat["id"]
+                if all(self.state.was_sent(today, recipient, key) for key in keys):
+                    continue
+                # Corrections only matter to recipients that got the original message
+                if isinstance(event, (Corrected, Removed)) and not self.state.was_sent(today, recipient, f"{event.presence_id}:check_in"):
+                    continue
+                # The policy merges and batches messages per recipient, they are only marked once queued
+                self.policy.submit(self.name, recipient, chat["type"], message, self._marker(today, keys))
+                logger.info(f"[{self.name}] {event.kind} message for kid {kid.id} ready for {recipient}.")
+
+    def _marker(self, today, keys):
+        def mark_sent(recipient):
+            for key in keys:
+                self.state.mark_sent(today, recipient, key)
+        # Saved once after the flush, by process_presences or the engine
+        return mark_sent
+
+
+def _format_time(value):
+    return datetime.fromisoformat(value).strftime('%H:%M')
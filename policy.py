@@ -0,0 +1,145 @@
+# policy.py
+
+import logging
+import threading
+from typing import Callable, Optional
+from clock import SYSTEM_CLOCK, Clock
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_MERGED = REGISTRY.counter(
+    "notifications_merged_total", "Notifications that went out as part of another message instead of on their own.",
+    ("account",))
+NOTIFICATIONS_DEFERRED = REGISTRY.counter(
+    "notifications_deferred_total", "Flushes that held a recipient's notifications back because of a rate limit.",
+    ("account", "limit"))
+
+
+class TokenBucket:
+    """Token bucket on any monotonic time in seconds, a rate of 0 disables it."""
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self, now: float) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now: float):
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+    def wait_time(self, now: float) -> float:
+        if self.ready(now):
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class NotificationPolicy:
+    """Merges notifications per recipient and rate limits sends per recipient and per account.
+
+    Nothing is dropped: a recipient over its limit keeps collecting messages, and they go out
+    together as one message once the bucket has a token again.
+    """
+
+    def __init__(self, send_message: Callable, recipient_rate: float = 20 / 3600, recipient_burst: int = 3,
+                 account_rate: float = 6 / 60, account_burst: int = 10, clock: Clock = SYSTEM_CLOCK):
+        self.send_message = send_message
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self.clock = clock
+        # (account, recipient, recipient type) -> [(text, on_sent)] in the order they were submitted
+        self._pending = {}
+        self._recipient_buckets = {}
+        self._account_buckets = {}
+        self._lock = threading.RLock()
+
+    def _recipient_bucket(self, recipient: str, now: float) -> TokenBucket:
+        if recipient not in self._recipient_buckets:
+            self._recipient_buckets[recipient] = TokenBucket(self.recipient_rate, self.recipient_burst, now)
+        return self._recipient_buckets[recipient]
+
+    def _account_bucket(self, account: str, now: float) -> TokenBucket:
+        if account not in self._account_buckets:
+            self._account_buckets[account] = TokenBucket(self.account_rate, self.account_burst, now)
+        return self._account_buckets[account]
+
+    def submit(self, account: str, recipient: str, recipient_type: str, text: str, on_sent: Callable = None):
+        with self._lock:
+            self._pending.setdefault((account, recipient, recipient_type), []).append((text, on_sent))
+
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def ready_in(self) -> Optional[float]:
+        """Seconds until the next pending message could go out, None if nothing is waiting."""
+        with self._lock:
+            if not self._pending:
+                return None
+            now = self.clock.time()
+            return min(
+                max(self._recipient_bucket(recipient, now).wait_time(now), self._account_bucket(account, now).wait_time(now))
+                for account, recipient, _ in self._pending
+            )
+
+    def flush(self) -> int:
+        """Sends everything the rate limits allow, returns the number of sends."""
+        with self._lock:
+            now = self.clock.time()
+            # Individuals with the same merged text share one send, each group gets its own
+            batches = {}
+            for key, items in self._pending.items():
+                account, recipient, recipient_type = key
+                if not self._recipient_bucket(recipient, now).ready(now):
+                    NOTIFICATIONS_DEFERRED.inc(account=account, limit="recipient")
+                    continue
+                # A message submitted again while it was held back only needs to be read once
+                text = "\n".join(dict.fromkeys(pending_text for pending_text, _ in items))
+                batch = (account, recipient_type, text, None if recipient_type == "individual" else recipient)
+                batches.setdefault(batch, []).append(key)
+
+            sends = 0
+            for (account, recipient_type, text, _), keys in batches.items():
+                account_bucket = self._account_bucket(account, now)
+                if not account_bucket.ready(now):
+                    NOTIFICATIONS_DEFERRED.inc(account=account, limit="account")
+                    continue
+                # A recipient pending for several accounts may have used its token in an earlier batch
+                held_back = [key for key in keys if not self._recipient_bucket(key[1], now).ready(now)]
+                if held_back:
+                    NOTIFICATIONS_DEFERRED.inc(len(held_back), account=account, limit="recipient")
+                    keys = [key for key in keys if key not in held_back]
+                    if not keys:
+                        continue
+                recipients = [recipient for _, recipient, _ in keys]
+                try:
+                    self.send_message(recipients, recipient_type, text)
+                except Exception as e:
+                    # Stays pending and is tried again with the next flush
+                    logger.error(f"[{account}] Error queueing message for {', '.join(recipients)}: {e}")
+                    continue
+                account_bucket.take(now)
+                sends += 1
+                for key in keys:
+                    self._recipient_bucket(key[1], now).take(now)
+                    items = self._pending.pop(key)
+                    if len(items) > 1:
+                        NOTIFICATIONS_MERGED.inc(len(items) - 1, account=account)
+                    for _, on_sent in items:
+                        if on_sent:
+                            on_sent(key[1])
+                logger.info(f"[{account}] Message queued for {', '.join(recipients)}.")
+            return sends
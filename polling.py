@@ -0,0 +1,80 @@
+# polling.py
+
+import logging
+from datetime import datetime
+from statistics import median
+from typing import Iterable, Optional
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+# Number of past presences per kid the arrival and pickup times are learned from
+HISTORY_SIZE = 40
+# Widest hot zone on each side of the usual time, a kid with erratic times is not worth polling fast for hours
+MAX_HOT_ZONE_MINUTES = 45
+# Before the hot zone the interval grows to at most this many base intervals, arrivals can be early
+MAX_COLD_FACTOR = 3
+
+
+def _minute_of_day(value: datetime) -> float:
+    return value.hour * 60 + value.minute + value.second / 60
+
+
+def typical_time(rows, weekday: int, field: str):
+    # Prefer the same weekday, pickup on Fridays is usually not the same as on Mondays
+    times = [datetime.fromisoformat(row[field]) for row in rows if row.get(field)]
+    same_weekday = [t for t in times if t.weekday() == weekday]
+    if len(same_weekday) >= 3:
+        times = same_weekday
+    if len(times) < 2:
+        return None
+    minutes = [_minute_of_day(t) for t in times]
+    center = median(minutes)
+    spread = median(abs(m - center) for m in minutes)
+    return center, spread
+
+
+class AdaptivePollScheduler:
+    """Picks the next poll interval of an account from its kids' presence state and history."""
+
+    def __init__(self, history, base_interval: float = 60, min_interval: Optional[float] = None, max_interval: float = 900,
+                 margin_minutes: float = 20, clock=SYSTEM_CLOCK):
+        self.history = history
+        self.clock = clock
+        self.base_interval = base_interval
+        # The hot zone polls at the base interval unless a faster one is configured
+        self.min_interval = min(min_interval or base_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.margin_minutes = margin_minutes
+
+    def kid_interval(self, kid_id: str, now: datetime) -> float:
+        today_rows = self.history.rows_on(kid_id, now.date())
+        latest = today_rows[0] if today_rows else None
+        if latest and latest.get("date_end"):
+            # Checked in and out already, only a second presence on the same day is left to detect
+            return self.max_interval
+
+        # Not here yet: wait for the arrival, otherwise wait for the pickup
+        past_rows = [row for row in self.history.recent(kid_id, HISTORY_SIZE + len(today_rows)) if row not in today_rows]
+        typical = typical_time(past_rows, now.weekday(), "date_end" if latest else "date_start")
+        if typical is None:
+            return self.base_interval
+
+        center, spread = typical
+        hot_zone = min(spread + self.margin_minutes, MAX_HOT_ZONE_MINUTES)
+        minutes_until_hot_zone = center - hot_zone - _minute_of_day(now)
+        if minutes_until_hot_zone > 0:
+            # Halve the distance to the hot zone, so we never sleep through its start
+            cold_interval = min(self.base_interval * MAX_COLD_FACTOR, self.max_interval)
+            return min(max(minutes_until_hot_zone * 60 / 2, self.base_interval), cold_interval)
+        if _minute_of_day(now) <= center + hot_zone:
+            return self.min_interval
+        # Later than usual, keep polling at the normal pace
+        return self.base_interval
+
+    def next_interval(self, kid_ids: Iterable[str], now: Optional[datetime] = None) -> Optional[float]:
+        now = now or self.clock.now()
+        intervals = [self.kid_interval(kid_id, now) for kid_id in kid_ids]
+        if not intervals:
+            return None
+        return min(intervals)
@@ -0,0 +1,231 @@
+# recipients.py
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+from utils import atomic_write_json
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows, writes are still atomic
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RECIPIENT_TYPES = ("individual", "group")
+
+
+def load_recipients(path: str = "chat_ids.json") -> list:
+    # Load recipients (individuals and groups)
+    try:
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                chat_ids = json.load(f)
+            logger.info(f"{len(chat_ids)} recipients loaded from '{path}'.")
+            logger.debug(f"Recipient list: {chat_ids}")
+            return chat_ids
+        logger.info(f"No recipients found in '{path}'. Please add recipients using 'add_recipient.py'.")
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing '{path}': {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error loading '{path}': {e}")
+    return []
+
+
+@contextmanager
+def _file_lock(path: str):
+    # A separate lock file, the recipients file itself is replaced on every write
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class RecipientRegistry:
+    """Recipients of one account, indexed by id and reloaded when the file changes on disk."""
+
+    def __init__(self, path: str = "chat_ids.json", check_interval: float = 5):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._chats = []
+        self._by_id = {}
+        self._by_kid = {}
+        self._signature = None
+        self._checked = 0.0
+        self._load(load_recipients(path), self._stat())
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size, stat.st_ino
+        except OSError:
+            return None
+
+    def _load(self, chats: list, signature):
+        # Swapped in as a whole, readers keep whichever version they already got
+        by_id = {chat["id"]: chat for chat in chats if isinstance(chat, dict) and chat.get("id")}
+        with self._lock:
+            self._chats = list(by_id.values())
+            self._by_id = by_id
+            self._by_kid = {}
+            self._signature = signature
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        # At most one stat() per check_interval, no matter how often the recipients are looked at
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return False
+        self._checked = now
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._load(load_recipients(self.path), signature)
+        logger.info(f"Recipients in '{self.path}' changed, {len(self._chats)} recipients active.")
+        return True
+
+    def all(self) -> List[dict]:
+        self.reload_if_changed()
+        return self._chats
+
+    def get(self, recipient_id: str) -> Optional[dict]:
+        self.reload_if_changed()
+        return self._by_id.get(recipient_id)
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __len__(self):
+        return len(self.all())
+
+    def for_kid(self, kid) -> List[dict]:
+        # Recipients without a "kids" list get notified about every child of the account
+        self.reload_if_changed()
+        chats = self._by_kid.get(kid.id)
+        if chats is None:
+            chats = [chat for chat in self._chats if not chat.get("kids") or any(kid.matches(k) for k in chat["kids"])]
+            self._by_kid[kid.id] = chats
+        return chats
+
+    def _update(self, change):
+        # Read, change and write under the file lock, so concurrent edits never overwrite each other
+        with _file_lock(self.path):
+            chats = []
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    chats = json.load(f)
+            result = change(chats)
+            atomic_write_json(self.path, chats, indent=4)
+            self._load(chats, self._stat())
+        return result
+
+    def add(self, recipient_id: str, recipient_type: str, kids: Iterable[str] = None) -> bool:
+        if recipient_type not in RECIPIENT_TYPES:
+            raise ValueError(f"Unknown recipient type: {recipient_type}")
+
+        def change(chats):
+            if any(chat.get("id") == recipient_id for chat in chats):
+                return False
+            chat = {"type": recipient_type, "id": recipient_id}
+            if kids:
+                chat["kids"] = list(kids)
+            chats.append(chat)
+            return True
+        return self._update(change)
+
+    def remove(self, recipient_id: str) -> bool:
+        def change(chats):
+            kept = [chat for chat in chats if chat.get("id") != recipient_id]
+            removed = len(kept) != len(chats)
+            chats[:] = kept
+            return removed
+        return self._update(change)
+
+    def import_recipients(self, entries: List[dict], replace: bool = False) -> int:
+        """Adds or updates all entries in one write, with replace=True they become the whole list."""
+        for entry in entries:
+            if not entry.get("id") or entry.get("type") not in RECIPIENT_TYPES:
+                raise ValueError(f"Invalid recipient: {entry}")
+
+        def change(chats):
+            by_id = {} if replace else {chat["id"]: chat for chat in chats if chat.get("id")}
+            for entry in entries:
+                by_id[entry["id"]] = {key: entry[key] for key in ("type", "id", "kids") if entry.get(key)}
+            chats[:] = list(by_id.values())
+            return len(entries)
+        return self._update(change)
+
+    def export(self) -> List[dict]:
+        self.reload_if_changed(force=True)
+        return [dict(chat) for chat in self._chats]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Empfänger verwalten (chat_ids.json).")
+    parser.add_argument("--file", default="chat_ids.json", help="Empfängerdatei, bei mehreren Konten chat_ids_<name>.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Empfänger hinzufügen")
+    add.add_argument("id")
+    add.add_argument("type", choices=RECIPIENT_TYPES)
+    add.add_argument("kids", nargs="*", help="HortPro-ID oder Vorname eines Kindes (Standard: alle Kinder)")
+    remove = commands.add_parser("remove", help="Empfänger entfernen")
+    remove.add_argument("ids", nargs="+")
+    commands.add_parser("list", help="Empfänger anzeigen")
+    bulk_import = commands.add_parser("import", help="Empfänger aus einer JSON-Datei übernehmen ('-' für stdin)")
+    bulk_import.add_argument("source")
+    bulk_import.add_argument("--replace", action="store_true", help="bestehende Empfänger ersetzen statt ergänzen")
+    export = commands.add_parser("export", help="Empfänger als JSON ausgeben")
+    export.add_argument("target", nargs="?", default="-")
+    args = parser.parse_args(argv)
+
+    registry = RecipientRegistry(args.file)
+    if args.command == "add":
+        if registry.add(args.id, args.type, args.kids):
+            print(f"Empfänger {args.id} als {args.type} hinzugefügt.")
+        else:
+            print("Empfänger bereits vorhanden.")
+    elif args.command == "remove":
+        for recipient_id in args.ids:
+            if registry.remove(recipient_id):
+                print(f"Empfänger {recipient_id} entfernt.")
+            else:
+                print(f"Empfänger {recipient_id} nicht gefunden.")
+    elif args.command == "list":
+        for chat in registry.all():
+            kids = f" ({', '.join(chat['kids'])})" if chat.get("kids") else ""
+            print(f"{chat['type']:<10} {chat['id']}{kids}")
+    elif args.command == "import":
+        if args.source == "-":
+            entries = json.load(sys.stdin)
+        else:
+            with open(args.source, "r") as f:
+                entries = json.load(f)
+        try:
+            count = registry.import_recipients(entries, replace=args.replace)
+        except ValueError as e:
+            print(f"Import abgebrochen: {e}")
+            return 1
+        print(f"{count} Empfänger importiert, {len(registry.all())} insgesamt.")
+    elif args.command == "export":
+        data = json.dumps(registry.export(), indent=4)
+        if args.target == "-":
+            print(data)
+        else:
+            with open(args.target, "w") as f:
+                f.write(data + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+# reports.py
+
+import argparse
+import asyncio
+import calendar
+import hashlib
+import json
+import logging
+import sqlite3
+import statistics
+import sys
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("week", "month")
+
+# A day only counts as unusual if it is this far off, a few minutes always vary
+OUTLIER_MIN_MINUTES = 30
+OUTLIER_MAD_FACTOR = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_cache (
+    kid_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    period TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (kid_id, kind, period)
+);
+CREATE TABLE IF NOT EXISTS digests_sent (
+    account TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    period TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (account, kind, period)
+);
+"""
+
+
+def period_of(day: date, kind: str) -> str:
+    if kind == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{day.year}-{day.month:02d}"
+
+
+def period_bounds(kind: str, period: str) -> Tuple[date, date]:
+    if kind == "week":
+        first = datetime.strptime(f"{period}-1", "%G-W%V-%u").date()
+        return first, first + timedelta(days=6)
+    year, month = (int(part) for part in period.split("-"))
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _minutes(value: str) -> int:
+    # Local time of day as HortPro reported it, in minutes after midnight
+    moment = datetime.fromisoformat(value)
+    return moment.hour * 60 + moment.minute
+
+
+def _format_minutes(minutes: float) -> str:
+    minutes = int(round(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _stats(values: List[int]) -> Optional[dict]:
+    if not values:
+        return None
+    return {"avg": statistics.mean(values), "min": min(values), "max": max(values)}
+
+
+def _outliers(values: Dict[str, int], label: str) -> List[dict]:
+    # Median and median absolute deviation, a single late pickup must not hide itself by moving the mean
+    if len(values) < 3:
+        return []
+    median = statistics.median(values.values())
+    mad = statistics.median(abs(value - median) for value in values.values())
+    limit = max(OUTLIER_MIN_MINUTES, OUTLIER_MAD_FACTOR * 1.4826 * mad)
+    return [{"day": day, "kind": label, "minutes": value, "median": median}
+            for day, value in values.items() if abs(value - median) > limit]
+
+
+def summarize(rows: List[dict]) -> dict:
+    """Attendance of one period: days, hours, arrival and pickup times and unusual days."""
+    arrivals, pickups, durations = {}, {}, {}
+    for row in rows:
+        day = row["day"]
+        arrival = _minutes(row["date_start"])
+        arrivals[day] = min(arrivals.get(day, arrival), arrival)
+        if row.get("date_end"):
+            pickup = _minutes(row["date_end"])
+            pickups[day] = max(pickups.get(day, pickup), pickup)
+            duration = row.get("duration")
+            if duration is None:
+                duration = (datetime.fromisoformat(row["date_end"]) - datetime.fromisoformat(row["date_start"])).total_seconds() // 60
+            durations[day] = durations.get(day, 0) + int(duration)
+    return {
+        "days": len(arrivals),
+        "hours": round(sum(durations.values()) / 60, 2),
+        "arrival": _stats(list(arrivals.values())),
+        "pickup": _stats(list(pickups.values())),
+        "outliers": sorted(_outliers(arrivals, "arrival") + _outliers(pickups, "pickup") + _outliers(durations, "duration"),
+                           key=lambda outlier: outlier["day"]),
+    }
+
+
+def format_summary(child: str, kind: str, period: str, summary: dict) -> str:
+    first, last = period_bounds(kind, period)
+    title = f"week {first.isocalendar()[1]}" if kind == "week" else first.strftime("%B %Y")
+    lines = [f"{child}, {title} ({first.strftime('%d.%m.')}-{last.strftime('%d.%m.')}): "
+             f"{summary['days']} day(s), {summary['hours']:.1f} hours."]
+    times = []
+    if summary["arrival"]:
+        times.append(f"arrival {_format_minutes(summary['arrival']['avg'])} "
+                     f"({_format_minutes(summary['arrival']['min'])}-{_format_minutes(summary['arrival']['max'])})")
+    if summary["pickup"]:
+        times.append(f"pickup {_format_minutes(summary['pickup']['avg'])} "
+                     f"({_format_minutes(summary['pickup']['min'])}-{_format_minutes(summary['pickup']['max'])})")
+    if times:
+        lines.append("Average " + ", ".join(times) + ".")
+    for outlier in summary["outliers"]:
+        day = date.fromisoformat(outlier["day"]).strftime("%a %d.%m.")
+        if outlier["kind"] == "duration":
+            lines.append(f"Unusual: {day} stayed {outlier['minutes'] / 60:.1f} hours.")
+        else:
+            lines.append(f"Unusual: {day} {outlier['kind']} at {_format_minutes(outlier['minutes'])}.")
+    return "\n".join(lines)
+
+
+class ReportCache:
+    """Period summaries keyed by a signature of their days, only periods whose days changed are recomputed."""
+
+    def __init__(self, path: str = "presences.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def load(self, kid_id: str, kind: str) -> Dict[str, Tuple[str, dict]]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT period, signature, summary FROM report_cache WHERE kid_id = ? AND kind = ?", (kid_id, kind))
+            return {period: (signature, json.loads(summary)) for period, signature, summary in cursor}
+
+    def store(self, kid_id: str, kind: str, entries: Dict[str, Tuple[str, dict]]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO report_cache (kid_id, kind, period, signature, summary) VALUES (?, ?, ?, ?, ?)",
+                [(kid_id, kind, period, signature, json.dumps(summary)) for period, (signature, summary) in entries.items()],
+            )
+
+    def digest_sent(self, account: str, kind: str, period: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM digests_sent WHERE account = ? AND kind = ? AND period = ?",
+                                      (account, kind, period)).fetchone() is not None
+
+    def mark_digest_sent(self, account: str, kind: str, period: str, sent_at: float):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO digests_sent (account, kind, period, sent_at) VALUES (?, ?, ?, ?)",
+                               (account, kind, period, sent_at))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PresenceReports:
+    """Weekly and monthly attendance summaries from the presence history."""
+
+    def __init__(self, history, cache: ReportCache):
+        self.history = history
+        self.cache = cache
+
+    def summaries(self, kid_id: str, kind: str, first_day: Optional[date] = None,
+                  last_day: Optional[date] = None) -> Dict[str, dict]:
+        if kind not in PERIODS:
+            raise ValueError(f"Unknown period: {kind}")
+        # One grouped query tells which periods changed, only their rows are read again
+        days = {}
+        for day, signature in self.history.day_signatures(kid_id, first_day, last_day).items():
+            days.setdefault(period_of(date.fromisoformat(day), kind), []).append((day, signature))
+        cached = self.cache.load(kid_id, kind)
+
+        result, changed = {}, {}
+        for period in sorted(days):
+            signature = hashlib.sha1(repr(sorted(days[period])).encode()).hexdigest()
+            if period in cached and cached[period][0] == signature:
+                result[period] = cached[period][1]
+                continue
+            summary = summarize(self.history.between(kid_id, *period_bounds(kind, period)))
+            changed[period] = (signature, summary)
+            result[period] = summary
+        if changed:
+            self.cache.store(kid_id, kind, changed)
+            logger.debug(f"Reports for kid {kid_id}: {len(changed)} of {len(result)} {kind}(s) recomputed.")
+        return result
+
+
+def _digest_due(now: datetime, kind: str, weekday: int, at: time) -> bool:
+    # Sent on the last day of the period, or the configured weekday for weeks
+    if now.time() < at:
+        return False
+    if kind == "week":
+        return now.weekday() == weekday
+    return now.day == calendar.monthrange(now.year, now.month)[1]
+
+
+def send_digests(engine, reports: PresenceReports, kind: str) -> int:
+    today = engine.clock.now().date()
+    period = period_of(today, kind)
+    first, last = period_bounds(kind, period)
+    messages = 0
+    for task in engine.accounts:
+        monitor = task.monitor
+        if reports.cache.digest_sent(monitor.name, kind, period):
+            continue
+        if not monitor.kids:
+            logger.warning(f"[{monitor.name}] No kids known yet, skipping the {kind} digest.")
+            continue
+        for kid in monitor.kids:
+            summary = reports.summaries(kid.id, kind, first, last).get(period)
+            if not summary:
+                continue
+            message = format_summary(kid.name or "Your child", kind, period, summary)
+            for chat in monitor.recipients_for_kid(kid):
+                engine.policy.submit(monitor.name, chat["id"], chat["type"], message)
+                messages += 1
+        reports.cache.mark_digest_sent(monitor.name, kind, period, engine.clock.time())
+    engine.policy.flush()
+    if messages:
+        logger.info(f"{kind.capitalize()} digest {period} queued for {messages} recipient(s).")
+    return messages
+
+
+async def run_digests(engine, reports: PresenceReports, kinds=("week",), weekday: int = 4, at: time = time(18, 0)):
+    """Sends the digests of the running period once they are due, checked every half hour."""
+    loop = asyncio.get_running_loop()
+    while True:
+        now = engine.clock.now()
+        for kind in kinds:
+            if _digest_due(now, kind, weekday, at):
+                try:
+                    await loop.run_in_executor(engine.process_executor, send_digests, engine, reports, kind)
+                except Exception as e:
+                    logger.error(f"Error sending the {kind} digest: {e}")
+        await asyncio.sleep(1800)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Anwesenheitsberichte pro Kind aus der lokalen Historie (presences.db).")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--period", choices=PERIODS, default="week")
+    parser.add_argument("--last", type=int, default=8, help="Anzahl der letzten Wochen bzw. Monate (0: alle)")
+    parser.add_argument("--kid", help="nur dieses Kind (HortPro-ID oder Vorname)")
+    parser.add_argument("--sync", action="store_true", help="vorher die komplette Historie von HortPro laden")
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    args = parser.parse_args(argv)
+
+    # Imported here, so the report functions stay usable without the HortPro client
+    from engine import load_accounts
+    from history import PresenceHistory
+    from main import StartupError, load_config
+    from models import Kid
+
+    try:
+        config = load_config(args.config)
+    except StartupError as e:
+        print(e)
+        return 1
+    history_path = config.get("history_path", "presences.db")
+    history = PresenceHistory(history_path)
+    reports = PresenceReports(history, ReportCache(history_path))
+
+    kids = [Kid(id=kid_id) for kid_id in history.kid_ids()]
+    if args.sync:
+        from hortapi import HortApi
+        kids = []
+        for account in load_accounts(config, cookie_path=config.get("cookie_path", "cookie.txt")):
+            api = HortApi(email=account.email, password=account.password, cookie_path=account.cookie_path,
+                          base_url=config.get("hortpro_url", "https://elternportal.hortpro.de"), name=account.name)
+            for kid in (Kid.from_api(data) for data in api.get_kids() or []):
+                history.sync(api, kid.id)
+                kids.append(kid)
+    if args.kid:
+        kids = [kid for kid in kids if kid.matches(args.kid)]
+        if not kids:
+            print(f"Kind '{args.kid}' nicht gefunden.")
+            return 1
+
+    output = {}
+    for kid in kids:
+        summaries = reports.summaries(kid.id, args.period)
+        periods = sorted(summaries)[-args.last:] if args.last else sorted(summaries)
+        output[kid.id] = {period: summaries[period] for period in periods}
+        if not args.json:
+            for period in periods:
+                print(format_summary(kid.name or kid.id, args.period, period, summaries[period]))
+                print()
+    if args.json:
+        print(json.dumps(output, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
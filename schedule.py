@@ -0,0 +1,178 @@
+# schedule.py
+
+import csv
+import logging
+import os
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional
+from zoneinfo import ZoneInfo
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Days of windows kept in the compiled index, it is rebuilt once time runs past it
+HORIZON_DAYS = 14
+# How far next_window_start looks ahead, e.g. across long school breaks
+MAX_LOOKAHEAD_DAYS = 366
+
+
+class CompiledSchedule:
+    """Weekly windows minus closure days, compiled into a sorted interval index."""
+
+    def __init__(self, rules: dict, closures: Iterable[date] = (), tz=None, horizon_days: int = HORIZON_DAYS,
+                 clock=SYSTEM_CLOCK):
+        self.rules = rules
+        self.clock = clock
+        self.closures = set(closures)
+        self.tz = tz
+        self.horizon_days = horizon_days
+        self._starts = []
+        self._ends = []
+        self._valid_from = None
+        self._valid_until = None
+
+    def __bool__(self):
+        return any(self.rules.values())
+
+    def now(self) -> datetime:
+        return self.clock.now(self.tz) if self.tz else self.clock.now().astimezone()
+
+    def _localize(self, moment: datetime) -> datetime:
+        # Naive times are wall clock times, astimezone() applies the local DST rules when no zone is configured
+        if moment.tzinfo is not None:
+            return moment.astimezone(self.tz) if self.tz else moment
+        return moment.replace(tzinfo=self.tz) if self.tz else moment.astimezone()
+
+    def _build(self, first_day: date, days: int):
+        windows = []
+        # Start a day early, an overnight window from the day before may still be open
+        for offset in range(-1, days):
+            day = first_day + timedelta(days=offset)
+            if day in self.closures:
+                continue
+            for start, end in self.rules.get(day.weekday(), []):
+                end_day = day if end > start else day + timedelta(days=1)
+                windows.append((self._localize(datetime.combine(day, start)), self._localize(datetime.combine(end_day, end))))
+        windows.sort()
+
+        starts, ends = [], []
+        for start, end in windows:
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return starts, ends
+
+    def _ensure_compiled(self, moment: datetime):
+        if self._valid_from is not None and self._valid_from <= moment < self._valid_until:
+            return
+        first_day = moment.date()
+        self._starts, self._ends = self._build(first_day, self.horizon_days + 1)
+        self._valid_from = self._localize(datetime.combine(first_day, time()))
+        self._valid_until = self._localize(datetime.combine(first_day + timedelta(days=self.horizon_days), time()))
+
+    def window_end(self, moment: datetime) -> Optional[datetime]:
+        """End of the window the moment is in, None outside of all windows."""
+        moment = self._localize(moment)
+        self._ensure_compiled(moment)
+        index = bisect_right(self._starts, moment) - 1
+        if index >= 0 and moment < self._ends[index]:
+            return self._ends[index]
+        return None
+
+    def next_window_start(self, moment: datetime) -> Optional[datetime]:
+        moment = self._localize(moment)
+        self._ensure_compiled(moment)
+        index = bisect_right(self._starts, moment)
+        if index < len(self._starts):
+            return self._starts[index]
+
+        # Nothing left in the index, e.g. during a long closure. It may have been compiled days ago,
+        # so the scan continues where the index ends, not a horizon after the moment
+        first_day = self._valid_until.date()
+        while first_day <= moment.date() + timedelta(days=MAX_LOOKAHEAD_DAYS):
+            starts, _ = self._build(first_day, self.horizon_days)
+            later = [start for start in starts if start > moment]
+            if later:
+                return later[0]
+            first_day += timedelta(days=self.horizon_days)
+        return None
+
+
+def load_closures(closures_file: Optional[str]) -> set:
+    """Closure days from a CSV (date[,end_date]) or an ICS calendar with all-day events."""
+    closures = set()
+    if not closures_file:
+        return closures
+    try:
+        if closures_file.lower().endswith(".ics"):
+            ranges = _read_ics_ranges(closures_file)
+        else:
+            ranges = _read_csv_ranges(closures_file)
+        for first_day, last_day in ranges:
+            day = first_day
+            while day <= last_day:
+                closures.add(day)
+                day += timedelta(days=1)
+        logger.info(f"{len(closures)} closure days loaded from {closures_file}.")
+    except Exception as e:
+        logger.error(f"Error loading closure days from {closures_file}: {e}")
+    return closures
+
+
+def _read_csv_ranges(path):
+    with open(path, mode='r') as csvfile:
+        reader = csv.DictReader(filter(lambda row: row.strip() and not row.strip().startswith('#'), csvfile))
+        for row in reader:
+            first_day = date.fromisoformat(row['date'].strip())
+            last_day = date.fromisoformat(row['end_date'].strip()) if (row.get('end_date') or '').strip() else first_day
+            yield first_day, last_day
+
+
+def _read_ics_ranges(path):
+    with open(path, mode='r') as f:
+        # Long lines are folded with a leading space in ICS files
+        content = f.read().replace("\r\n ", "").replace("\n ", "")
+    start = end = None
+    for line in content.splitlines():
+        name, _, value = line.partition(":")
+        key = name.split(";")[0].upper()
+        if key == "BEGIN" and value == "VEVENT":
+            start = end = None
+        elif key == "DTSTART":
+            start = datetime.strptime(value[:8], "%Y%m%d").date()
+        elif key == "DTEND":
+            end = datetime.strptime(value[:8], "%Y%m%d").date()
+        elif key == "END" and value == "VEVENT" and start:
+            # DTEND of all-day events is exclusive
+            yield start, (end - timedelta(days=1)) if end and end > start else start
+
+
+def load_schedule(schedule_file='scheduler.csv', closures_file=None, timezone=None, clock=SYSTEM_CLOCK):
+    rules = {}
+    try:
+        with open(schedule_file, mode='r') as csvfile:
+            reader = csv.DictReader(filter(lambda row: not row.strip().startswith('#'), csvfile))
+            for row in reader:
+                day = WEEKDAYS.index(row['day_of_week'].strip().lower())
+                start_time = datetime.strptime(row['start_time'].strip(), '%H:%M').time()
+                end_time = datetime.strptime(row['end_time'].strip(), '%H:%M').time()
+                rules.setdefault(day, []).append((start_time, end_time))
+        logger.info(f"Schedule loaded from {schedule_file}.")
+    except Exception as e:
+        logger.error(f"Error loading schedule from {schedule_file}: {e}")
+
+    tz = None
+    if timezone:
+        try:
+            tz = ZoneInfo(timezone)
+        except Exception as e:
+            logger.error(f"Unknown time zone '{timezone}', using the system time zone: {e}")
+    if closures_file and not os.path.exists(closures_file):
+        logger.error(f"Closure days file {closures_file} not found.")
+        closures_file = None
+    return CompiledSchedule(rules, load_closures(closures_file), tz=tz, clock=clock)
@@ -0,0 +1,407 @@
+# signal_cli.py
+
+import itertools
+import json
+import logging
+import subprocess
+import threading
+import time
+from typing import List
+from metrics import SIGNAL_SEND_SECONDS, SIGNAL_SENDS
+
+logger = logging.getLogger(__name__)
+
+RECIPIENT_TYPES = ("individual", "group")
+
+
+class SignalCliError(Exception):
+    pass
+
+
+class SignalCliReplyError(SignalCliError):
+    """The daemon answered with an error, it is still running and usable."""
+
+
+class _PendingCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        # An error reply of the daemon, as opposed to the daemon going away
+        self.replied = False
+
+
+class SignalCliDaemon:
+    """Long-lived `signal-cli jsonRpc` process, shared by all sends."""
+
+    def __init__(self, signal_cli_path: str, signal_number: str, request_timeout: float = 30, restart_delay: float = 5,
+                 cli_lock: threading.Lock = None):
+        self.signal_cli_path = signal_cli_path
+        self.signal_number = signal_number
+        self.request_timeout = request_timeout
+        self.restart_delay = restart_delay
+        # Held while the process starts, so it never overlaps a signal-cli subprocess on the same account
+        self.cli_lock = cli_lock or threading.Lock()
+        self._process = None
+        self._stopped = False
+        self._started_at = 0.0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count(1)
+        # Called with every JSON-RPC notification, e.g. incoming messages
+        self.on_notification = None
+
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        with self._lock:
+            self._ensure_running()
+
+    def _ensure_running(self):
+        if self.is_running():
+            return
+        if self._process is not None and not self._stopped:
+            logger.warning(f"signal-cli daemon exited with code {self._process.returncode}. Restarting.")
+            # Don't spin on a daemon that dies right after startup, let the caller fall back instead
+            if time.monotonic() - self._started_at < self.restart_delay:
+                raise SignalCliError("signal-cli daemon is crash-looping")
+        cmd = [self.signal_cli_path, "-u", self.signal_number, "jsonRpc"]
+        with self.cli_lock:
+            try:
+                self._process = subprocess.Popen(
+                    cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1
+                )
+            except OSError as e:
+                self._process = None
+                raise SignalCliError(f"Could not start signal-cli daemon: {e}")
+        self._stopped = False
+        self._started_at = time.monotonic()
+        threading.Thread(target=self._read_loop, args=(self._process,), name="signal-cli-reader", daemon=True).start()
+        logger.info(f"signal-cli daemon started (pid {self._process.pid}).")
+
+    def _read_loop(self, process):
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.debug(f"Ignoring non-JSON output from signal-cli: {line}")
+                continue
+            waiter = self._pending.pop(message.get("id"), None)
+            if waiter is None:
+                logger.debug(f"signal-cli notification: {message.get('method')}")
+                if self.on_notification:
+                    try:
+                        self.on_notification(message)
+                    except Exception as e:
+                        logger.error(f"Error handling signal-cli notification: {e}")
+                continue
+            if "error" in message:
+                waiter.error = message["error"].get("message", str(message["error"]))
+                waiter.replied = True
+            else:
+                waiter.result = message.get("result")
+            waiter.event.set()
+
+        process.wait()
+        # Wake up everybody still waiting on this process
+        for request_id, waiter in list(self._pending.items()):
+            if self._pending.pop(request_id, None) is waiter:
+                waiter.error = f"signal-cli daemon exited with code {process.returncode}"
+                waiter.event.set()
+
+    def call(self, method: str, params: dict, timeout: float = None):
+        request_id = next(self._ids)
+        waiter = _PendingCall()
+        request = json.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": request_id})
+        with self._lock:
+            self._ensure_running()
+            self._pending[request_id] = waiter
+            try:
+                self._process.stdin.write(request + "\n")
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self._pending.pop(request_id, None)
+                raise SignalCliError(f"Could not write to signal-cli daemon: {e}")
+
+        if not waiter.event.wait(timeout or self.request_timeout):
+            self._pending.pop(request_id, None)
+            raise SignalCliError(f"Timeout waiting for signal-cli '{method}' response")
+        if waiter.error:
+            raise (SignalCliReplyError if waiter.replied else SignalCliError)(waiter.error)
+        return waiter.result
+
+    def send(self, recipients: List[str], recipient_type: str, message: str):
+        params = {"message": message}
+        if recipient_type == "group":
+            params["groupId"] = recipients[0]
+        else:
+            params["recipient"] = list(recipients)
+        return self.call("send", params)
+
+    def stop(self):
+        with self._lock:
+            if not self.is_running():
+                return
+            logger.info("Stopping signal-cli daemon.")
+            # The next start is not a crash recovery
+            self._stopped = True
+            try:
+                self._process.stdin.close()
+                self._process.terminate()
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            except OSError:
+                pass
+
+
+class SignalSender:
+    """Sends messages through the signal-cli daemon, falling back to one signal-cli process per message."""
+
+    def __init__(self, signal_cli_path: str, signal_number: str, backend: str = "daemon", send_timeout: float = 60):
+        self.signal_cli_path = signal_cli_path
+        self.signal_number = signal_number
+        self.send_timeout = send_timeout
+        # Only one signal-cli process may use the account's data directory at a time
+        self.cli_lock = threading.Lock()
+        self.daemon = None
+        if backend == "daemon":
+            self.daemon = SignalCliDaemon(signal_cli_path, signal_number, request_timeout=send_timeout, cli_lock=self.cli_lock)
+        elif backend != "subprocess":
+            logger.warning(f"Unknown signal backend '{backend}', using subprocess.")
+
+    def uses_daemon(self) -> bool:
+        return self.daemon is not None and self.daemon.is_running()
+
+    def start(self):
+        if self.daemon:
+            try:
+                self.daemon.start()
+            except SignalCliError as e:
+                logger.error(f"{e}. Messages will be sent via subprocess.")
+
+    def send(self, recipients: List[str], recipient_type: str, message: str) -> List[str]:
+        """Sends one message to several recipients at once, returns the recipients it failed for."""
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        if recipient_type not in RECIPIENT_TYPES:
+            logger.warning(f"Unknown recipient type: {recipient_type}")
+            return list(recipients)
+        if recipient_type == "group" and len(recipients) > 1:
+            # Every group is a message of its own
+            return [group for group in recipients if self.send([group], "group", message)]
+
+        started = time.monotonic()
+        failed = self._send(recipients, recipient_type, message)
+        elapsed = time.monotonic() - started
+        backend = "daemon" if self.uses_daemon() else "subprocess"
+        for recipient in recipients:
+            SIGNAL_SEND_SECONDS.observe(elapsed, recipient=recipient, backend=backend)
+            SIGNAL_SENDS.inc(recipient=recipient, result="failed" if recipient in failed else "sent")
+        return failed
+
+    def _send(self, recipients: List[str], recipient_type: str, message: str) -> List[str]:
+        logger.debug(f"Sending message to {recipient_type} {', '.join(recipients)}: {message}")
+        if self.daemon:
+            try:
+                result = self.daemon.send(recipients, recipient_type, message)
+                logger.debug(f"signal-cli daemon result: {result}")
+                # Results of a group send are per member, one unreachable member is no reason to send it twice
+                failed = _failed_recipients(result, recipients) if recipient_type == "individual" else []
+                sent = [recipient for recipient in recipients if recipient not in failed]
+                if sent:
+                    logger.info(f"Message sent to {', '.join(sent)}: {message}")
+                if failed:
+                    logger.error(f"Error sending message to {', '.join(failed)}.")
+                return failed
+            except SignalCliReplyError as e:
+                # signal-cli refused this message, another process would do the same
+                logger.error(f"Error sending message to {', '.join(recipients)}: {e}")
+                return list(recipients)
+            except SignalCliError as e:
+                logger.warning(f"signal-cli daemon send to {', '.join(recipients)} failed, falling back to subprocess: {e}")
+                # A hung daemon still holds the account lock, which would block the subprocess as well
+                self.daemon.stop()
+        return self._send_subprocess(recipients, recipient_type, message)
+
+    def _send_subprocess(self, recipients: List[str], recipient_type: str, message: str) -> List[str]:
+        """One signal-cli process for all recipients, returns the ones it failed for."""
+        if recipient_type == "group":
+            cmd = [self.signal_cli_path, "-u", self.signal_number, "-o", "json", "send", "-g", recipients[0], "-m", message]
+        else:
+            cmd = [self.signal_cli_path, "-u", self.signal_number, "-o", "json", "send", "-m", message, *recipients]
+        recipient = ", ".join(recipients)
+
+        try:
+            # Suppress Signal-CLI debug messages by redirecting stderr to /dev/null
+            with self.cli_lock:
+                result = subprocess.run(
+                    cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=self.send_timeout
+                )
+        except subprocess.TimeoutExpired:
+            logger.error(f"Timeout sending message to {recipient} after {self.send_timeout} seconds.")
+            return list(recipients)
+        except Exception as e:
+            logger.error(f"Unexpected error sending message to {recipient}: {e}")
+            return list(recipients)
+        logger.debug(f"Command Output (stdout): {result.stdout.strip()}")
+
+        # A non-zero exit may only mean that some of the recipients failed, the JSON output says which
+        output = _parse_json_output(result.stdout)
+        if output is not None and output.get("results") and recipient_type == "individual":
+            failed = _failed_recipients(output, recipients)
+        elif result.returncode == 0:
+            failed = []
+        elif recipient_type == "individual" and len(recipients) > 1:
+            # Nothing tells who failed, one at a time so the others don't get the message again on every retry
+            logger.warning(f"signal-cli send to {recipient} failed with code {result.returncode}, sending one by one.")
+            return [single for single in recipients if self._send_subprocess([single], recipient_type, message)]
+        else:
+            logger.error(f"Return Code: {result.returncode}")
+            failed = list(recipients)
+
+        sent = [r for r in recipients if r not in failed]
+        if sent:
+            logger.info(f"Message sent to {', '.join(sent)}: {message}")
+        if failed:
+            logger.error(f"Error sending message to {', '.join(failed)}.")
+        return failed
+
+    def stop(self):
+        if self.daemon:
+            self.daemon.stop()
+
+
+
+class SignalReceiver:
+    """The one place incoming Signal messages are received, through the daemon or a periodic `signal-cli receive`."""
+
+    def __init__(self, sender: SignalSender, interval: float = 600, check_interval: float = 30, on_message=None):
+        self.sender = sender
+        self.interval = interval
+        self.check_interval = check_interval
+        self.on_message = on_message
+        self.mode = None
+        self.last_success = None
+        self.last_message = None
+        self.last_error = None
+        self.messages_received = 0
+        self._stop = threading.Event()
+        self._thread = None
+        if sender.daemon:
+            sender.daemon.on_notification = self._handle_notification
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="signal-receiver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def health(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "mode": self.mode,
+            "last_success": self.last_success,
+            "last_message": self.last_message,
+            "last_error": self.last_error,
+            "messages_received": self.messages_received,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self.interval
+            try:
+                if self.sender.daemon and self._ensure_daemon():
+                    # The daemon receives continuously, we only have to keep it alive
+                    self.mode = "daemon"
+                    wait = self.check_interval
+                else:
+                    self.mode = "subprocess"
+                    self._receive_once()
+                self.last_success = time.time()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Error receiving Signal messages: {e}")
+            self._stop.wait(wait)
+
+    def _ensure_daemon(self) -> bool:
+        # The daemon starts under the sender's cli_lock, never while a send or receive subprocess runs
+        try:
+            self.sender.daemon.start()
+            return True
+        except SignalCliError as e:
+            logger.warning(f"signal-cli daemon unavailable, receiving via subprocess: {e}")
+            return False
+
+    def _receive_once(self):
+        logger.info("Receiving Signal messages to maintain Signal connection...")
+        cmd = [self.sender.signal_cli_path, "-u", self.sender.signal_number, "-o", "json", "receive", "--timeout", "5"]
+        with self.sender.cli_lock:
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=self.sender.send_timeout)
+        for line in result.stdout.splitlines():
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            self._handle_envelope(message.get("envelope") or {})
+        logger.debug("Receive completed successfully.")
+
+    def _handle_notification(self, message: dict):
+        if message.get("method") == "receive":
+            self._handle_envelope((message.get("params") or {}).get("envelope") or {})
+
+    def _handle_envelope(self, envelope: dict):
+        data = envelope.get("dataMessage") or {}
+        text = data.get("message")
+        if not text:
+            return
+        self.messages_received += 1
+        self.last_message = time.time()
+        source = envelope.get("sourceNumber") or envelope.get("source")
+        group_id = (data.get("groupInfo") or {}).get("groupId")
+        logger.info(f"Received message from {source}{f' in group {group_id}' if group_id else ''}.")
+        if self.on_message:
+            try:
+                self.on_message(source, group_id, text)
+            except Exception as e:
+                logger.error(f"Error handling message from {source}: {e}")
+
+def _parse_json_output(stdout: str):
+    # `-o json send` prints one JSON object, older versions print nothing
+    for line in reversed(stdout.splitlines()):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def _failed_recipients(result, recipients: List[str]) -> List[str]:
+    # signal-cli reports one entry per recipient, anything but SUCCESS needs another attempt
+    if not isinstance(result, dict) or not result.get("results"):
+        return []
+    failed = []
+    for entry in result["results"]:
+        if entry.get("type") == "SUCCESS":
+            continue
+        address = entry.get("recipientAddress") or {}
+        matches = [r for r in recipients if r in (address.get("number"), address.get("uuid"), address.get("username"))]
+        if not matches:
+            # Can't tell who it was, so all of them are retried
+            return list(recipients)
+        failed.extend(matches)
+    return failed
@@ -0,0 +1,67 @@
+# state.py
+
+import json
+import logging
+import os
+import threading
+from datetime import date, timedelta
+from utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationState:
+    """Which notifications went out, per day and recipient. Only written to disk when something changed."""
+
+    def __init__(self, path: str = "notifications_sent.json", keep_days: int = 7):
+        self.path = path
+        self.keep_days = keep_days
+        self.days = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.days = {day: {recipient: set(keys) for recipient, keys in recipients.items()} for day, recipients in data.items()}
+            logger.info(f"Notification state loaded from '{self.path}'.")
+        except Exception as e:
+            logger.error(f"Error loading notification state from '{self.path}': {e}")
+
+    def was_sent(self, day: date, recipient: str, key: str) -> bool:
+        with self._lock:
+            return key in self.days.get(day.isoformat(), {}).get(recipient, ())
+
+    def was_sent_to_anyone(self, day: date, key: str) -> bool:
+        with self._lock:
+            return any(key in keys for keys in self.days.get(day.isoformat(), {}).values())
+
+    def mark_sent(self, day: date, recipient: str, key: str):
+        with self._lock:
+            keys = self.days.setdefault(day.isoformat(), {}).setdefault(recipient, set())
+            if key not in keys:
+                keys.add(key)
+                self.dirty = True
+
+    def prune(self, today: date):
+        oldest = (today - timedelta(days=self.keep_days)).isoformat()
+        with self._lock:
+            for day in [day for day in self.days if day < oldest]:
+                del self.days[day]
+                self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            data = {day: {recipient: sorted(keys) for recipient, keys in recipients.items()} for day, recipients in self.days.items()}
+            try:
+                atomic_write_json(self.path, data, separators=(",", ":"))
+                self.dirty = False
+                logger.debug(f"Notification state saved to '{self.path}'.")
+            except OSError as e:
+                logger.error(f"Error saving notification state to '{self.path}': {e}")
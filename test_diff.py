@@ -0,0 +1,91 @@
+# test_diff.py
+
+from datetime import date
+from diff import PresenceDiff
+from history import PresenceHistory
+from models import CheckIn, CheckOut, Corrected, Removed
+
+TODAY = date(2024, 10, 22)
+
+
+def row(presence_id, start, end=None):
+    return {"id": presence_id, "date_start": start, "date_end": end, "duration": None}
+
+
+class EmptyHistory:
+    def recent(self, kid_id, limit):
+        return []
+
+
+def kinds(events):
+    return [(type(event), event.presence_id) for event in events]
+
+
+def test_new_rows_are_check_ins_and_check_outs():
+    diff = PresenceDiff(EmptyHistory())
+    events = diff.diff("k", [row("b", "2024-10-22T12:00:00+02:00"), row("a", "2024-10-21T12:00:00+02:00", "2024-10-21T15:00:00+02:00")], TODAY)
+    assert kinds(events) == [(CheckIn, "b"), (CheckIn, "a"), (CheckOut, "a")]
+
+
+def test_unchanged_payload_has_no_events():
+    diff = PresenceDiff(EmptyHistory())
+    rows = [row("a", "2024-10-22T12:00:00+02:00")]
+    diff.diff("k", rows, TODAY)
+    assert diff.diff("k", rows, TODAY) == []
+
+
+def test_check_out_after_check_in():
+    diff = PresenceDiff(EmptyHistory())
+    diff.diff("k", [row("a", "2024-10-22T12:00:00+02:00")], TODAY)
+    events = diff.diff("k", [row("a", "2024-10-22T12:00:00+02:00", "2024-10-22T15:00:00+02:00")], TODAY)
+    assert kinds(events) == [(CheckOut, "a")]
+
+
+def test_corrected_start_and_end():
+    diff = PresenceDiff(EmptyHistory())
+    diff.diff("k", [row("a", "2024-10-22T12:00:00+02:00", "2024-10-22T15:00:00+02:00")], TODAY)
+    events = diff.diff("k", [row("a", "2024-10-22T11:30:00+02:00", "2024-10-22T15:30:00+02:00")], TODAY)
+    assert [(type(event), event.field, event.old_value) for event in events] == [
+        (Corrected, "date_start", "2024-10-22T12:00:00+02:00"),
+        (Corrected, "date_end", "2024-10-22T15:00:00+02:00"),
+    ]
+
+
+def test_withdrawn_check_out_is_a_correction():
+    diff = PresenceDiff(EmptyHistory())
+    diff.diff("k", [row("a", "2024-10-22T12:00:00+02:00", "2024-10-22T15:00:00+02:00")], TODAY)
+    events = diff.diff("k", [row("a", "2024-10-22T12:00:00+02:00")], TODAY)
+    assert len(events) == 1
+    assert isinstance(events[0], Corrected) and events[0].field == "date_end" and events[0].date_end is None
+
+
+def test_removed_row_inside_the_page():
+    diff = PresenceDiff(EmptyHistory())
+    diff.diff("k", [row("b", "2024-10-22T12:00:00+02:00"), row("a", "2024-10-21T12:00:00+02:00")], TODAY)
+    events = diff.diff("k", [row("a", "2024-10-21T12:00:00+02:00")], TODAY)
+    assert kinds(events) == [(Removed, "b")]
+
+
+def test_scrolled_off_row_is_not_removed():
+    diff = PresenceDiff(EmptyHistory())
+    diff.diff("k", [row("b", "2024-10-21T12:00:00+02:00"), row("a", "2024-10-18T12:00:00+02:00")], TODAY)
+    events = diff.diff("k", [row("c", "2024-10-22T12:00:00+02:00"), row("b", "2024-10-21T12:00:00+02:00")], TODAY)
+    assert kinds(events) == [(CheckIn, "c")]
+
+
+def test_empty_payload_keeps_the_snapshot():
+    diff = PresenceDiff(EmptyHistory())
+    rows = [row("a", "2024-10-22T12:00:00+02:00")]
+    diff.diff("k", rows, TODAY)
+    assert diff.diff("k", [], TODAY) == []
+    assert diff.diff("k", rows, TODAY) == []
+
+
+def test_seed_leaves_out_today(tmp_path):
+    history = PresenceHistory(str(tmp_path / "presences.db"))
+    rows = [row("b", "2024-10-22T12:00:00+02:00"), row("a", "2024-10-21T12:00:00+02:00", "2024-10-21T15:00:00+02:00")]
+    history.store("k", rows)
+    # After a restart only today's row comes up again, NotificationState filters what was already sent
+    events = PresenceDiff(history).diff("k", rows, TODAY)
+    assert kinds(events) == [(CheckIn, "b")]
+    history.close()
@@ -0,0 +1,132 @@
+# test_policy.py
+
+from datetime import datetime
+from clock import VirtualClock
+from policy import NotificationPolicy, TokenBucket
+
+
+class Sender:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def __call__(self, recipients, recipient_type, text):
+        if self.fail:
+            raise RuntimeError("outbox full")
+        self.sent.append((sorted(recipients), recipient_type, text))
+
+
+def make_policy(sender, **limits):
+    clock = VirtualClock(datetime(2024, 10, 22, 12))
+    return NotificationPolicy(sender, clock=clock, **limits), clock
+
+
+def test_messages_to_one_recipient_are_merged():
+    sender = Sender()
+    policy, _ = make_policy(sender)
+    marked = []
+    policy.submit("a", "+491", "individual", "checked in", marked.append)
+    policy.submit("a", "+491", "individual", "checked out", marked.append)
+    assert policy.flush() == 1
+    assert sender.sent == [(["+491"], "individual", "checked in\nchecked out")]
+    assert marked == ["+491", "+491"]
+    assert not policy.has_pending()
+
+
+def test_resubmitted_text_is_sent_once():
+    sender = Sender()
+    policy, _ = make_policy(sender)
+    policy.submit("a", "+491", "individual", "same")
+    policy.submit("a", "+491", "individual", "same")
+    policy.flush()
+    assert sender.sent == [(["+491"], "individual", "same")]
+
+
+def test_accounts_are_not_merged():
+    sender = Sender()
+    policy, _ = make_policy(sender)
+    policy.submit("a", "+491", "individual", "checked in")
+    policy.submit("b", "+491", "individual", "checked in")
+    assert policy.flush() == 2
+
+
+def test_recipient_limit_holds_across_accounts():
+    sender = Sender()
+    policy, clock = make_policy(sender, recipient_rate=1 / 600, recipient_burst=1)
+    policy.submit("a", "+491", "individual", "from a")
+    policy.submit("b", "+491", "individual", "from b")
+    assert policy.flush() == 1
+    assert policy.has_pending()
+    assert policy._recipient_buckets["+491"].tokens == 0
+    clock.advance(600)
+    assert policy.flush() == 1
+    assert [text for _, _, text in sender.sent] == ["from a", "from b"]
+
+
+def test_individuals_share_a_send_groups_do_not():
+    sender = Sender()
+    policy, _ = make_policy(sender)
+    for recipient in ("+491", "+492"):
+        policy.submit("a", recipient, "individual", "checked in")
+    for group in ("g1", "g2"):
+        policy.submit("a", group, "group", "checked in")
+    assert policy.flush() == 3
+    assert sender.sent == [(["+491", "+492"], "individual", "checked in"),
+                           (["g1"], "group", "checked in"), (["g2"], "group", "checked in")]
+
+
+def test_recipient_over_its_limit_is_deferred_and_merged():
+    sender = Sender()
+    policy, clock = make_policy(sender, recipient_rate=1 / 600, recipient_burst=1)
+    policy.submit("a", "+491", "individual", "checked in")
+    policy.flush()
+    marked = []
+    policy.submit("a", "+491", "individual", "correction", marked.append)
+    policy.submit("a", "+491", "individual", "checked out", marked.append)
+    assert policy.flush() == 0
+    assert marked == []
+    assert policy.ready_in() == 600
+    clock.advance(600)
+    assert policy.flush() == 1
+    assert sender.sent[-1] == (["+491"], "individual", "correction\nchecked out")
+    assert marked == ["+491", "+491"]
+
+
+def test_account_limit_defers_the_whole_batch():
+    sender = Sender()
+    policy, clock = make_policy(sender, account_rate=1 / 60, account_burst=1)
+    policy.submit("a", "+491", "individual", "one")
+    policy.submit("a", "g1", "group", "two")
+    assert policy.flush() == 1
+    assert policy.has_pending()
+    clock.advance(60)
+    assert policy.flush() == 1
+    assert not policy.has_pending()
+
+
+def test_failed_send_stays_pending():
+    sender = Sender(fail=True)
+    policy, _ = make_policy(sender)
+    marked = []
+    policy.submit("a", "+491", "individual", "checked in", marked.append)
+    assert policy.flush() == 0
+    assert policy.has_pending() and marked == []
+    sender.fail = False
+    assert policy.flush() == 1
+    assert marked == ["+491"]
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=0.5, burst=2, now=0)
+    bucket.take(0)
+    bucket.take(0)
+    assert not bucket.ready(0)
+    assert bucket.wait_time(0) == 2
+    assert bucket.ready(2)
+
+
+def test_zero_rate_disables_the_bucket():
+    bucket = TokenBucket(rate=0, burst=1, now=0)
+    for _ in range(10):
+        bucket.take(0)
+    assert bucket.ready(0) and bucket.wait_time(0) == 0
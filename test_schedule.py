@@ -0,0 +1,81 @@
+# test_schedule.py
+
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from schedule import CompiledSchedule
+
+BERLIN = ZoneInfo("Europe/Berlin")
+UTC = ZoneInfo("UTC")
+WEEKDAYS = {day: [(time(9), time(17))] for day in range(5)}
+
+
+def at(*args):
+    return datetime(*args, tzinfo=BERLIN)
+
+
+def test_inside_and_outside_a_window():
+    schedule = CompiledSchedule(WEEKDAYS, tz=BERLIN)
+    # 2024-10-22 is a Tuesday
+    assert schedule.window_end(at(2024, 10, 22, 12)) == at(2024, 10, 22, 17)
+    assert schedule.window_end(at(2024, 10, 22, 17)) is None
+    assert schedule.next_window_start(at(2024, 10, 22, 17)) == at(2024, 10, 23, 9)
+
+
+def test_weekend_is_skipped():
+    schedule = CompiledSchedule(WEEKDAYS, tz=BERLIN)
+    assert schedule.window_end(at(2024, 10, 26, 12)) is None
+    assert schedule.next_window_start(at(2024, 10, 25, 18)) == at(2024, 10, 28, 9)
+
+
+def test_overnight_window_from_the_day_before():
+    # Friday 22:00 until Saturday 06:00
+    schedule = CompiledSchedule({4: [(time(22), time(6))]}, tz=BERLIN)
+    assert schedule.window_end(at(2024, 10, 25, 23)) == at(2024, 10, 26, 6)
+    # Compiled from Saturday on, the window that opened on Friday is still found
+    assert CompiledSchedule({4: [(time(22), time(6))]}, tz=BERLIN).window_end(at(2024, 10, 26, 1)) == at(2024, 10, 26, 6)
+
+
+def test_adjacent_windows_are_merged():
+    schedule = CompiledSchedule({1: [(time(9), time(12)), (time(12), time(17))]}, tz=BERLIN)
+    assert schedule.window_end(at(2024, 10, 22, 10)) == at(2024, 10, 22, 17)
+
+
+def test_windows_across_dst_changes():
+    night = {6: [(time(1), time(5))]}
+    spring = CompiledSchedule(night, tz=BERLIN)
+    end = spring.window_end(at(2024, 3, 31, 1, 30))
+    assert end == at(2024, 3, 31, 5)
+    # Aware datetimes in the same zone subtract as wall clock times, the real length needs UTC
+    assert end.astimezone(UTC) - at(2024, 3, 31, 1).astimezone(UTC) == timedelta(hours=3)
+    autumn = CompiledSchedule(night, tz=BERLIN)
+    end = autumn.window_end(at(2024, 10, 27, 1, 30))
+    assert end == at(2024, 10, 27, 5)
+    assert end.astimezone(UTC) - at(2024, 10, 27, 1).astimezone(UTC) == timedelta(hours=5)
+
+
+def test_closure_days_have_no_windows():
+    schedule = CompiledSchedule(WEEKDAYS, closures=[date(2024, 10, 23)], tz=BERLIN)
+    assert schedule.window_end(at(2024, 10, 23, 12)) is None
+    assert schedule.next_window_start(at(2024, 10, 22, 18)) == at(2024, 10, 24, 9)
+
+
+def test_closure_longer_than_the_horizon():
+    closures = [date(2024, 10, 21) + timedelta(days=offset) for offset in range(40)]
+    schedule = CompiledSchedule(WEEKDAYS, closures=closures, tz=BERLIN, horizon_days=14)
+    assert schedule.next_window_start(at(2024, 10, 21, 8)) == at(2024, 12, 2, 9)
+
+
+def test_closure_after_the_index_was_compiled():
+    rules = {day: [(time(8), time(17))] for day in range(5)}
+    closures = [date(2026, 10, 9) + timedelta(days=offset) for offset in range(13)]
+    schedule = CompiledSchedule(rules, closures=closures, tz=BERLIN)
+    # Compiled on Monday, queried on Saturday when nothing is left in the index
+    assert schedule.window_end(at(2026, 10, 5, 9)) == at(2026, 10, 5, 17)
+    assert schedule.next_window_start(at(2026, 10, 10, 9)) == at(2026, 10, 22, 8)
+    assert CompiledSchedule(rules, closures=closures, tz=BERLIN).next_window_start(at(2026, 10, 10, 9)) == at(2026, 10, 22, 8)
+
+
+def test_no_windows_at_all():
+    schedule = CompiledSchedule({}, tz=BERLIN)
+    assert not schedule
+    assert schedule.next_window_start(at(2024, 10, 22, 8)) is None
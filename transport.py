@@ -0,0 +1,167 @@
+# transport.py
+
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import requests
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Worth another try: rate limited or the portal is having trouble
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+HORTPRO_RETRIES = REGISTRY.counter("hortpro_retries_total", "Retried HortPro requests.", ("host", "reason"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a host that is known to be failing."""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit for {host} is open, next attempt in {int(retry_in)} seconds")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Stops requests to a host after repeated failures, then lets a single trial request through."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_until = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if time.monotonic() < self.opened_until or self._trial_running:
+                return False
+            self.state = "half_open"
+            self._trial_running = True
+            return True
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("HortPro is reachable again, closing the circuit.")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def release_trial(self):
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            # The server said when to come back, that beats counting failures
+            if retry_after or self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state == "closed":
+                    logger.warning(f"HortPro failed {self.failures} time(s), pausing requests.")
+                self.state = "open"
+                self.opened_until = time.monotonic() + (retry_after or self.reset_timeout)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+REGISTRY.gauge("hortpro_circuit_open", "1 while requests to a host are paused by the circuit breaker.",
+               lambda: {(host,): int(breaker.state != "closed") for host, breaker in list(_breakers.items())}, ("host",))
+
+
+def get_breaker(host: str, failure_threshold: int = 5, reset_timeout: float = 60) -> CircuitBreaker:
+    # One breaker per host, shared by every account that talks to it
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(failure_threshold, reset_timeout)
+        return _breakers[host]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpTransport:
+    """requests.Session calls with connect/read timeouts, jittered retries and a per-host circuit breaker."""
+
+    def __init__(self, session: requests.Session, connect_timeout: float = 5, read_timeout: float = 20,
+                 max_retries: int = 2, backoff: float = 1, max_backoff: float = 10, total_timeout: float = 45,
+                 breaker_failures: int = 5, breaker_reset: float = 60):
+        self.session = session
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.total_timeout = total_timeout
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        host = urlparse(url).netloc
+        breaker = get_breaker(host, self.breaker_failures, self.breaker_reset)
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(host, breaker.retry_in())
+            retry_after = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                breaker.record_failure()
+                if not self._should_retry(attempt, started, host, type(e).__name__):
+                    raise
+            except BaseException:
+                # Not the host's fault, but the trial slot of a half-open breaker must be given back
+                breaker.release_trial()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                breaker.record_failure(retry_after)
+                if not self._should_retry(attempt, started, host, str(response.status_code), retry_after):
+                    return response
+
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            logger.warning(f"{method} {urlparse(url).path} failed, retry {attempt + 1} in {delay:.1f} seconds.")
+            time.sleep(delay)
+            attempt += 1
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.5)
+
+    def _should_retry(self, attempt: int, started: float, host: str, reason: str, retry_after: float = None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        delay = retry_after if retry_after is not None else self.backoff * 2 ** attempt
+        # Waiting longer than max_backoff, or past the total budget, is the circuit breaker's job
+        if delay > self.max_backoff or time.monotonic() - started + delay > self.total_timeout:
+            return False
+        HORTPRO_RETRIES.inc(host=host, reason=reason)
+        return True